@@ -0,0 +1,423 @@
+"""
+bench_dataset_20.py
+-------------------
+Benchmarks for the synthetic patient generator in dataset_20.py.
+
+Levels:
+- micro: per-call cost of the hot helpers (gen_glucose_and_hba1c,
+  pick_med_history, _normalize_probs, gen_name, make_dob) and of
+  random-access patient materialization (gen_patient_at)
+- e2e:   patients/sec and peak RSS for N patients, with and without the
+  BRFSS reference CSV, per output format (json / csv / parquet)
+- cohort: bytes/patient of list-of-dicts vs the columnar Cohort, and the
+  cost of a typical columnar filter
+- risk:  RiskEngine scoring, RiskIndex build, top-K "needs attention" query
+  and incremental re-scoring at 100k / 1M patients
+- validate: streaming validator throughput (rows/sec) per file format
+
+Every e2e case runs in its own child process so peak RSS is not polluted
+by earlier (larger) cases. Patients are streamed from iter_patients into the
+savers, so peak RSS does not grow with N. A case that crashes, is killed, or
+exceeds --case-timeout is recorded as {"error": ...} and the suite moves on.
+Peak RSS needs the `resource` module, so it is reported as null on Windows.
+
+--compare flags metrics that got worse than --threshold, cases that fail now
+but did not in the baseline, and baseline cases of the selected levels that
+are missing from this run.
+
+Run:
+    python data/bench_dataset_20.py --save baseline.json
+    python data/bench_dataset_20.py --compare baseline.json --threshold 0.10
+    python data/bench_dataset_20.py --levels e2e --sizes 1000 1000000 10000000 --case-timeout 36000
+
+(At ~1.3k patients/s, one N=1e7 case takes a couple of hours; memory stays flat.)
+
+If the BRFSS CSV is not next to dataset_20.py (it is not shipped with the repo),
+a synthetic BRFSS-shaped reference frame is used for the "with reference" cases.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue as queue_module
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import dataset_20 as ds
+from cohort import Cohort
+from risk import RiskEngine, RiskIndex
+from validate_cohort import validate_file
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_FORMATS = ["json", "csv", "parquet"]
+DEFAULT_THRESHOLD = 0.10
+
+# Metric name -> True if larger is better (used by --compare)
+HIGHER_IS_BETTER = {
+    "ns_per_call": False,
+    "patients_per_sec": True,
+    "peak_rss_mb": False,
+    "bytes_per_patient": False,
+    "filter_ms": False,
+    "score_ms": False,
+    "build_ms": False,
+    "top_k_us": False,
+    "update_ms": False,
+    "rows_per_sec": True,
+}
+
+
+# -----------------------------
+# 1) HELPERS
+# -----------------------------
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS reports bytes
+    return round(peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0, 1)
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def synthetic_reference(n_rows=20_000, seed=2015):
+    """BRFSS-shaped stand-in (same column names/codes) for when the real CSV is absent."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Diabetes_012": rng.choice([0, 1, 2], size=n_rows, p=[0.84, 0.02, 0.14]).astype(float),
+        "HighBP": rng.binomial(1, 0.43, n_rows).astype(float),
+        "HighChol": rng.binomial(1, 0.42, n_rows).astype(float),
+        "BMI": np.clip(rng.normal(28.4, 6.6, n_rows).round(), 12, 98),
+        "Smoker": rng.binomial(1, 0.44, n_rows).astype(float),
+        "PhysActivity": rng.binomial(1, 0.76, n_rows).astype(float),
+        "HvyAlcoholConsump": rng.binomial(1, 0.06, n_rows).astype(float),
+        "Sex": rng.binomial(1, 0.44, n_rows).astype(float),
+        "Age": rng.integers(1, 14, n_rows).astype(float),
+    })
+
+
+def resolve_reference(ref_csv):
+    """Return (label, DataFrame) for the "with reference" cases."""
+    ref_df = ds.load_reference(ref_csv)
+    if ref_df is not None:
+        return "brfss", ref_df
+    return "synthetic", synthetic_reference()
+
+
+# -----------------------------
+# 2) MICRO BENCHMARKS
+# -----------------------------
+MICRO_CASES = {
+    "gen_glucose_and_hba1c": lambda: ds.gen_glucose_and_hba1c("T2", 6, 31.2, 92.5, "moderate"),
+    "pick_med_history": lambda: ds.pick_med_history("T2", 62),
+    "_normalize_probs": lambda: ds._normalize_probs([0.30, 0.22, 0.22, 0.10, 0.16], 5),
+    "gen_name": lambda: ds.gen_name(),
+    "make_dob": lambda: ds.make_dob(57),
+    "gen_patient_at": lambda: ds.gen_patient_at(1_998_123),
+}
+
+
+def run_micro(number=2_000, repeat=5):
+    results = {}
+    for name, fn in MICRO_CASES.items():
+        best = min(timeit.Timer(fn).repeat(repeat=repeat, number=number))
+        results[f"micro/{name}"] = {"ns_per_call": round(best / number * 1e9, 1)}
+        print(f"  {name:<24} {results[f'micro/{name}']['ns_per_call']:>12,.1f} ns/call")
+    return results
+
+
+# -----------------------------
+# 3) END-TO-END BENCHMARKS
+# -----------------------------
+def _e2e_case(n_patients, ref_csv, use_ref, fmt, out_dir, queue):
+    """
+    Child-process body: stream iter_patients straight into one saver (no full list of
+    dicts), report timings and peak RSS. Any exception is reported instead of a result.
+    """
+    try:
+        np.random.seed(7)
+        random.seed(7)
+        ref_df = resolve_reference(ref_csv)[1] if use_ref else None
+
+        path = os.path.join(out_dir, f"bench_{n_patients}.{fmt}")
+        t0 = time.perf_counter()
+        ds.SAVERS[fmt](ds.iter_patients(n_patients, ref_df), path)
+        elapsed = time.perf_counter() - t0
+
+        queue.put({
+            "seconds": round(elapsed, 4),
+            "patients_per_sec": round(n_patients / elapsed, 1),
+            "output_bytes": os.path.getsize(path),
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    except BaseException as exc:
+        queue.put({"error": f"{type(exc).__name__}: {exc}"})
+
+
+def _wait_for_result(proc, queue, case_timeout=None, poll_seconds=1.0):
+    """
+    Wait for the child's result without hanging if it dies (exception, OOM kill) or
+    runs past case_timeout seconds; failures come back as {"error": ...}.
+    """
+    started = time.perf_counter()
+    while True:
+        try:
+            return queue.get(timeout=poll_seconds)
+        except queue_module.Empty:
+            pass
+        if not proc.is_alive():
+            # the result may have been queued just before exit
+            try:
+                return queue.get(timeout=poll_seconds)
+            except queue_module.Empty:
+                return {"error": f"child process exited with code {proc.exitcode}"}
+        if case_timeout is not None and time.perf_counter() - started > case_timeout:
+            proc.terminate()
+            return {"error": f"timed out after {case_timeout:g} s"}
+
+
+def run_e2e(sizes, formats, ref_csv, case_timeout=None):
+    if "parquet" in formats and not parquet_available():
+        print("  (skipping parquet: install pyarrow)")
+        formats = [f for f in formats if f != "parquet"]
+
+    ref_label = resolve_reference(ref_csv)[0]
+    ctx = mp.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for n in sizes:
+            for use_ref in (False, True):
+                for fmt in formats:
+                    key = f"e2e/n={n}/ref={ref_label if use_ref else 'none'}/fmt={fmt}"
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=_e2e_case, args=(n, ref_csv, use_ref, fmt, out_dir, queue))
+                    proc.start()
+                    res = _wait_for_result(proc, queue, case_timeout)
+                    proc.join()
+                    results[key] = res
+                    if "error" in res:
+                        print(f"  {key:<44} FAILED: {res['error']}")
+                        continue
+                    rss = "n/a" if res["peak_rss_mb"] is None else f"{res['peak_rss_mb']:,.1f} MB"
+                    print(f"  {key:<44} {res['patients_per_sec']:>12,.1f} patients/s   peak RSS {rss}")
+    return results
+
+
+# -----------------------------
+# 4) COHORT MEMORY & FILTERS
+# -----------------------------
+def run_cohort(n_patients=20_000, n_filter=1_000_000):
+    np.random.seed(7)
+    random.seed(7)
+    tracemalloc.start()
+    patients = ds.generate_patients(n_patients)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cohort = Cohort.from_records(patients)
+    big = Cohort.concat([cohort] * max(1, n_filter // n_patients))
+
+    def uncontrolled_t2():
+        return big[big.isin("diabetes_type", ["T2"]) & (big["hba1c_percent"] >= 8.0) & big.has_history("nephropathy")]
+
+    best = min(timeit.Timer(uncontrolled_t2).repeat(repeat=5, number=1))
+    results = {
+        "cohort/dicts": {"bytes_per_patient": round(dict_bytes / n_patients, 1)},
+        "cohort/columnar": {"bytes_per_patient": cohort.bytes_per_patient},
+        f"cohort/filter/n={len(big)}": {"filter_ms": round(best * 1e3, 3)},
+    }
+    ratio = dict_bytes / n_patients / cohort.bytes_per_patient
+    print(f"  list of dicts {dict_bytes / n_patients:>10,.1f} B/patient")
+    print(f"  Cohort        {cohort.bytes_per_patient:>10,.1f} B/patient   ({ratio:.0f}x smaller)")
+    print(f"  filter T2 & A1c>=8 & nephropathy over {len(big):,} patients: {best * 1e3:,.3f} ms")
+    return results
+
+
+# -----------------------------
+# 5) RISK SCORING & NEEDS-ATTENTION INDEX
+# -----------------------------
+def run_risk(sizes=(100_000, 1_000_000), n_seed=5_000, k=50, n_update=1_000):
+    np.random.seed(7)
+    random.seed(7)
+    seed_cohort = Cohort.generate(n_seed)
+    engine = RiskEngine()
+    rng = np.random.default_rng(7)
+    results = {}
+    for n in sizes:
+        cohort = Cohort.concat([seed_cohort] * max(1, n // n_seed))
+        score_s = min(timeit.Timer(lambda: engine.score(cohort)).repeat(repeat=3, number=1))
+        scores = engine.score(cohort)
+        build_s = min(timeit.Timer(lambda: RiskIndex(scores)).repeat(repeat=3, number=1))
+        index = RiskIndex(scores)
+        top_k_s = min(timeit.Timer(lambda: index.top_k(k)).repeat(repeat=5, number=1_000)) / 1_000
+
+        positions = rng.choice(len(cohort), n_update, replace=False)
+        new_scores = rng.uniform(0, scores.max() + 1, n_update).astype(np.float32)
+        t0 = time.perf_counter()
+        index.update(positions, new_scores)
+        update_s = time.perf_counter() - t0
+
+        key = f"risk/n={len(cohort)}"
+        results[key] = {
+            "score_ms": round(score_s * 1e3, 3),
+            "build_ms": round(build_s * 1e3, 3),
+            "top_k_us": round(top_k_s * 1e6, 3),
+            "update_ms": round(update_s * 1e3, 3),
+        }
+        print(f"  {key:<14} score {score_s * 1e3:>9,.2f} ms   build {build_s * 1e3:>9,.2f} ms   "
+              f"top-{k} {top_k_s * 1e6:>7,.2f} us   update {n_update} {update_s * 1e3:>7,.2f} ms")
+    return results
+
+
+# -----------------------------
+# 6) STREAMING VALIDATOR
+# -----------------------------
+def run_validate(n_patients=300_000, n_seed=5_000, formats=("json", "csv")):
+    np.random.seed(7)
+    random.seed(7)
+    seed_cohort = Cohort.generate(n_seed)
+    cohort = Cohort.concat([seed_cohort] * max(1, n_patients // n_seed))
+    cohort.columns["patient_num"] = ds.ID_OFFSET + np.arange(len(cohort), dtype=np.int32)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for fmt in formats:
+            if fmt == "parquet" and not parquet_available():
+                continue
+            path = os.path.join(out_dir, f"validate.{fmt}")
+            cohort.save(path)
+            t0 = time.perf_counter()
+            report = validate_file(path)
+            elapsed = time.perf_counter() - t0
+            key = f"validate/n={len(cohort)}/fmt={fmt}"
+            results[key] = {"rows_per_sec": round(report["rows"] / elapsed, 1)}
+            print(f"  {key:<34} {report['rows'] / elapsed:>12,.1f} rows/s   "
+                  f"({report['errors']} errors, {report['warnings']} warnings)")
+    return results
+
+
+# -----------------------------
+# 7) BASELINES & COMPARISON
+# -----------------------------
+def environment():
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(baseline, current, threshold, levels=None):
+    """
+    Compare two result dicts metric-by-metric.
+    Returns a list of (key, metric, old, new, change) where the change is worse than threshold.
+    change is relative and signed so that positive always means "worse". A case that failed
+    now but not in the baseline is reported as metric "error" with change None, and a baseline
+    case absent from `current` as metric "missing" (only for `levels`, if given).
+    """
+    regressions = []
+    for key in baseline:
+        if key not in current and (levels is None or key.split("/", 1)[0] in levels):
+            regressions.append((key, "missing", None, None, None))
+    for key, metrics in current.items():
+        old_metrics = baseline.get(key)
+        if old_metrics is None:
+            continue
+        if "error" in metrics and "error" not in old_metrics:
+            regressions.append((key, "error", None, metrics["error"], None))
+            continue
+        for metric, higher_better in HIGHER_IS_BETTER.items():
+            old, new = old_metrics.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if higher_better else (new - old) / old
+            if change > threshold:
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dataset_20 synthetic patient generator.")
+    parser.add_argument("--levels", nargs="+", choices=["micro", "e2e", "cohort", "risk", "validate"],
+                        default=["micro", "e2e", "cohort", "risk", "validate"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="cohort sizes for e2e (e.g. 1000 ... 10000000)")
+    parser.add_argument("--formats", nargs="+", choices=sorted(ds.SAVERS), default=DEFAULT_FORMATS)
+    parser.add_argument("--case-timeout", type=float, help="seconds before an e2e case is killed (default: none)")
+    parser.add_argument("--ref-csv", default=ds.REF_CSV, help="BRFSS reference CSV for the with-reference cases")
+    parser.add_argument("--number", type=int, default=2_000, help="calls per micro timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="micro timing runs (best is kept)")
+    parser.add_argument("--save", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown flagged as a regression (default 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if "micro" in args.levels:
+        print("Micro benchmarks:")
+        results.update(run_micro(args.number, args.repeat))
+    if "e2e" in args.levels:
+        print("End-to-end benchmarks:")
+        results.update(run_e2e(args.sizes, args.formats, args.ref_csv, args.case_timeout))
+    if "cohort" in args.levels:
+        print("Cohort memory & filters:")
+        results.update(run_cohort())
+    if "risk" in args.levels:
+        print("Risk scoring & needs-attention index:")
+        results.update(run_risk())
+    if "validate" in args.levels:
+        print("Streaming validator:")
+        results.update(run_validate())
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"\nBaseline saved: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold, args.levels)
+        if not regressions:
+            print(f"\nNo regressions above {args.threshold:.0%} vs {args.compare}")
+            return 0
+        print(f"\nRegressions above {args.threshold:.0%} vs {args.compare}:")
+        for key, metric, old, new, change in regressions:
+            if metric == "missing":
+                print(f"  {key} missing from this run")
+            elif change is None:
+                print(f"  {key} failed: {new}")
+            else:
+                print(f"  {key} {metric}: {old:,.1f} -> {new:,.1f} ({change:+.1%} worse)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,480 @@
+"""
+cohort.py
+---------
+Compact, column-oriented in-memory cohort for dataset_20 patients.
+
+A list of 29-key dicts costs a few kB per patient (dict + boxed numbers +
+repeated strings). A Cohort keeps one typed NumPy array per field instead:
+- categoricals (sex, diabetes_type, diet_pattern, ...) -> small-int codes
+- name -> first/last name codes
+- medical_history -> uint8 bitmask over MED_HISTORY_OPTIONS
+- dob / hba1c_date -> int32 days since 1970-01-01
+- patient_id "P2000" -> int32 2000 (int64 if an ID does not fit)
+- labs / vitals -> the narrowest int/float dtype that holds their range
+  (widened on load if a value does not fit, never wrapped)
+
+That is ~60 bytes per patient. Slicing with a slice returns views (no copy);
+filters are plain NumPy masks. The dict/JSON schema is produced only at export
+(to_records / to_dataframe / save).
+
+LazyCohort is the storage-free counterpart: a virtual cohort of any size whose
+patients are generated on access from per-patient RNG streams
+(dataset_20.gen_patient_at), so cohort[i], cohort.get("P2000123") and slices
+cost O(1) / O(slice) regardless of the cohort size.
+
+Example:
+    from cohort import Cohort
+    cohort = Cohort.generate(1_000_000)
+    uncontrolled = cohort[cohort.isin("diabetes_type", ["T1", "T2"]) & (cohort["hba1c_percent"] >= 8)]
+    uncontrolled[:100].save("uncontrolled_top100.json")
+
+    virtual = LazyCohort(10_000_000)
+    virtual.get("P2000123")             # built on demand, nothing else generated
+    demo = virtual[5_000:5_100].to_cohort()
+"""
+
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+
+import dataset_20 as ds
+
+
+# -----------------------------
+# 0) SCHEMA
+# -----------------------------
+# Output field order (matches the dicts built by dataset_20.gen_patient)
+SCHEMA = [
+    "patient_id", "name", "dob", "age", "sex", "diabetes_type", "years_since_diagnosis",
+    "height_cm", "weight_kg", "BMI", "systolic_bp", "diastolic_bp", "heart_rate_bpm",
+    "fasting_glucose_mg_dL", "postprandial_glucose_mg_dL", "hba1c_percent", "hba1c_date",
+    "total_cholesterol_mg_dL", "ldl_cholesterol_mg_dL", "hdl_cholesterol_mg_dL", "triglycerides_mg_dL",
+    "smoking_status", "alcohol_use", "physical_activity_level", "diet_pattern",
+    "family_history", "allergies", "medical_history", "ongoing_medications",
+]
+
+# Known category values; values not listed here are appended per cohort on load
+CATEGORIES = {
+    "first_name": tuple(sorted({n for names in ds.FIRST_NAMES.values() for n in names})),
+    "last_name": tuple(sorted({n for names in ds.LAST_NAMES.values() for n in names})),
+    "sex": ("Female", "Male"),
+    "diabetes_type": ("0", "T1", "T2"),
+    "smoking_status": ("never", "former", "current"),
+    "alcohol_use": ("none", "moderate", "heavy"),
+    "physical_activity_level": ("low", "moderate", "high"),
+    "diet_pattern": ("traditional", "high refined carbs", "Mediterranean-like", "vegetarian", "mixed/Western"),
+    "family_history": ("no", "yes"),
+    "allergies": ("no", "yes"),
+    "ongoing_medications": ("none", "Metformin", "sitagliptin"),
+}
+
+# Numeric fields and their storage dtype (ranges follow the np.clip bounds in dataset_20)
+NUMERIC_DTYPES = {
+    "age": np.uint8,
+    "years_since_diagnosis": np.uint8,
+    "height_cm": np.uint8,
+    "weight_kg": np.float32,
+    "BMI": np.float32,
+    "systolic_bp": np.uint8,
+    "diastolic_bp": np.uint8,
+    "heart_rate_bpm": np.uint8,
+    "fasting_glucose_mg_dL": np.float32,
+    "postprandial_glucose_mg_dL": np.float32,
+    "hba1c_percent": np.float32,
+    "total_cholesterol_mg_dL": np.uint16,
+    "ldl_cholesterol_mg_dL": np.uint8,
+    "hdl_cholesterol_mg_dL": np.uint8,
+    "triglycerides_mg_dL": np.uint16,
+}
+
+# float32 columns are rounded back to these decimals on export
+DECIMALS = {
+    "weight_kg": 1,
+    "BMI": 1,
+    "fasting_glucose_mg_dL": 1,
+    "postprandial_glucose_mg_dL": 1,
+    "hba1c_percent": 2,
+}
+
+DATE_COLUMNS = ("dob", "hba1c_date")
+
+# Bit i of the medical_history mask <=> MED_HISTORY_OPTIONS[i]
+HISTORY_BITS = {cond: 1 << i for i, cond in enumerate(ds.MED_HISTORY_OPTIONS)}
+
+
+# -----------------------------
+# 1) ENCODE / DECODE HELPERS
+# -----------------------------
+def _code_dtype(n_categories):
+    if n_categories <= 1 << 8:
+        return np.uint8
+    return np.uint16 if n_categories <= 1 << 16 else np.uint32
+
+
+def encode_categorical(values, categories=()):
+    """Strings -> (codes, categories); unseen values are appended to categories."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    categories = list(categories)
+    index = {c: i for i, c in enumerate(categories)}
+    for u in uniques:
+        if u not in index:
+            index[u] = len(categories)
+            categories.append(u)
+    lookup = np.array([index[u] for u in uniques], dtype=np.int64)
+    if (codes < 0).any():
+        raise ValueError("categorical column contains missing values")
+    return lookup[codes].astype(_code_dtype(len(categories))), tuple(categories)
+
+
+def encode_history(values):
+    """'none' | 'cond; cond; ...' -> uint8 bitmask over MED_HISTORY_OPTIONS."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    masks = np.zeros(len(uniques), dtype=np.uint8)
+    for j, text in enumerate(uniques):
+        for cond in str(text).split(";"):
+            cond = cond.strip()
+            if cond and cond != "none":
+                if cond not in HISTORY_BITS:
+                    raise ValueError(f"unknown medical_history item: {cond!r}")
+                masks[j] |= HISTORY_BITS[cond]
+    return masks[codes]
+
+
+# All 2^7 masks -> joined text (sorted, like pick_med_history)
+HISTORY_TEXT = np.array([
+    "; ".join(sorted(c for c, bit in HISTORY_BITS.items() if m & bit)) or "none"
+    for m in range(1 << len(HISTORY_BITS))
+], dtype=object)
+
+
+def encode_dates(values):
+    """Date strings -> int32 days since 1970-01-01 (ISO fast path, else pandas parsing)."""
+    try:
+        days = np.asarray(values, dtype="datetime64[D]")
+    except ValueError:
+        days = pd.to_datetime(pd.Series(values), format="mixed").to_numpy().astype("datetime64[D]")
+    return days.astype(np.int64).astype(np.int32)
+
+
+def decode_dates(days):
+    return days.astype("datetime64[D]").astype(str).astype(object)
+
+
+def encode_numeric(values, dtype, col):
+    """
+    Numbers -> `dtype`, checked before the cast: integer columns must be whole and present
+    (NaN / non-numeric raise ValueError), and values outside the dtype's range widen it to the
+    next integer type instead of wrapping. Float columns keep NaN for missing values.
+    """
+    raw = pd.Series(np.asarray(values, dtype=object))
+    num = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=np.float64)
+    nan = np.isnan(num)
+    if nan.any():
+        missing = raw.isna().to_numpy() | (raw.astype(str).str.strip() == "").to_numpy()
+        if (nan & ~missing).any():
+            raise ValueError(f"{col}: non-numeric values")
+    if np.dtype(dtype).kind == "f":
+        return num.astype(dtype)
+    if nan.any():
+        raise ValueError(f"{col}: missing values in an integer column")
+    if (num != np.round(num)).any():
+        raise ValueError(f"{col}: non-integer values in an integer column")
+    if len(num):
+        lo, hi = num.min(), num.max()
+        candidates = [dtype] + ([np.uint16, np.uint32, np.uint64] if lo >= 0 else [np.int16, np.int32, np.int64])
+        for dtype in candidates:
+            if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+                break
+        else:
+            raise ValueError(f"{col}: values out of range [{lo}, {hi}]")
+    return num.astype(dtype)
+
+
+def encode_patient_ids(values):
+    """'P2000' -> 2000 (int32, or int64 if some ID does not fit)."""
+    ids = pd.Series(values, dtype=object).astype(str)
+    if not ids.str.fullmatch(r"P\d{1,18}").all():
+        raise ValueError("patient_id values must look like 'P<digits>' (at most 18 digits)")
+    nums = ids.str.slice(1).astype(np.int64).to_numpy()
+    if len(nums) and nums.max() > np.iinfo(np.int32).max:
+        return nums
+    return nums.astype(np.int32)
+
+
+# -----------------------------
+# 2) COHORT
+# -----------------------------
+class Cohort:
+    """
+    Column store of patients. `columns` maps storage column -> 1-D array, all the same length:
+    patient_num, first_name, last_name, dob, hba1c_date, medical_history, every CATEGORIES
+    field (as codes) and every NUMERIC_DTYPES field. `categories` maps each coded column to
+    its category tuple.
+    """
+
+    def __init__(self, columns, categories=None):
+        lengths = {len(col) for col in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+        self.columns = columns
+        self.categories = dict(CATEGORIES if categories is None else categories)
+
+    # ---- construction ----
+    @classmethod
+    def from_columns(cls, data):
+        """Build from a mapping of SCHEMA field -> sequence (e.g. a DataFrame or dict of lists)."""
+        columns, categories = {}, {}
+        columns["patient_num"] = encode_patient_ids(data["patient_id"])
+
+        # reindex: a one-word-only (or empty) column has no second (or any) split column
+        names = pd.Series(np.asarray(data["name"], dtype=object), dtype=object) \
+            .str.split(" ", n=1, expand=True).reindex(columns=[0, 1]).fillna("")
+        for col, part in (("first_name", names[0]), ("last_name", names[1])):
+            columns[col], categories[col] = encode_categorical(part, CATEGORIES[col])
+
+        for col in DATE_COLUMNS:
+            columns[col] = encode_dates(data[col])
+        for col, dtype in NUMERIC_DTYPES.items():
+            columns[col] = encode_numeric(data[col], dtype, col)
+        for col, cats in CATEGORIES.items():
+            if col not in ("first_name", "last_name"):
+                columns[col], categories[col] = encode_categorical(
+                    pd.Series(data[col], dtype=object).astype(str), cats)
+        columns["medical_history"] = encode_history(data["medical_history"])
+        return cls(columns, categories)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from dataset_20 patient dicts."""
+        records = list(records)
+        return cls.from_columns({field: [r[field] for r in records] for field in SCHEMA})
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a JSON / CSV / Parquet export."""
+        fmt = path.rsplit(".", 1)[-1].lower()
+        if fmt == "json":
+            with open(path, encoding="utf-8") as f:
+                return cls.from_records(json.load(f))
+        if fmt == "csv":
+            return cls.from_columns(pd.read_csv(path, dtype={"diabetes_type": str}, keep_default_na=False))
+        if fmt == "parquet":
+            return cls.from_columns(pd.read_parquet(path))
+        raise ValueError(f"unsupported file type: {path}")
+
+    @classmethod
+    def generate(cls, n_patients, ref_df=None, chunk_size=100_000):
+        """Generate straight into columns, holding at most chunk_size dicts at a time."""
+        patients = ds.iter_patients(n_patients, ref_df)
+        chunks = []
+        while True:
+            chunk = list(itertools.islice(patients, chunk_size))
+            if not chunk:
+                break
+            chunks.append(cls.from_records(chunk))
+        return cls.concat(chunks) if chunks else cls.from_records([])
+
+    @classmethod
+    def concat(cls, cohorts):
+        """Stack cohorts row-wise (category codes are remapped if the category lists differ)."""
+        cohorts = list(cohorts)
+        if not cohorts:
+            return cls.from_records([])
+        categories = dict(cohorts[0].categories)
+        for c in cohorts[1:]:
+            for col, cats in c.categories.items():
+                extra = [v for v in cats if v not in set(categories[col])]
+                if extra:
+                    categories[col] = tuple(categories[col]) + tuple(extra)
+
+        columns = {}
+        for col in cohorts[0].columns:
+            if col in categories:
+                parts = []
+                for c in cohorts:
+                    if c.categories[col] == categories[col]:
+                        parts.append(c.columns[col])
+                    else:
+                        index = {v: i for i, v in enumerate(categories[col])}
+                        remap = np.array([index[v] for v in c.categories[col]], dtype=np.int64)
+                        parts.append(remap[c.columns[col]])
+                columns[col] = np.concatenate(parts).astype(_code_dtype(len(categories[col])))
+            else:
+                columns[col] = np.concatenate([c.columns[col] for c in cohorts])
+        return cls(columns, categories)
+
+    # ---- access ----
+    def __len__(self):
+        return len(self.columns["patient_num"])
+
+    def __getitem__(self, key):
+        """
+        cohort["hba1c_percent"] -> storage array (codes for categoricals)
+        cohort[5]               -> one patient dict
+        cohort[10:20]           -> Cohort of views (zero-copy)
+        cohort[mask] / [idx]    -> Cohort (copy)
+        """
+        if isinstance(key, str):
+            return self.columns[key]
+        if isinstance(key, (int, np.integer)):
+            n = len(self)
+            if not -n <= key < n:
+                raise IndexError("cohort index out of range")
+            return self[int(key) % n:int(key) % n + 1].to_records()[0]
+        return Cohort({col: arr[key] for col, arr in self.columns.items()}, self.categories)
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def __repr__(self):
+        return f"Cohort({len(self)} patients, {self.nbytes / 1e6:.1f} MB)"
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self.columns.values())
+
+    @property
+    def bytes_per_patient(self):
+        return sum(arr.itemsize for arr in self.columns.values())
+
+    # ---- columnar filters (return boolean masks) ----
+    def isin(self, col, values):
+        """Mask of patients whose categorical `col` is one of `values`."""
+        cats = self.categories[col]
+        wanted = [cats.index(v) for v in values if v in cats]
+        return np.isin(self.columns[col], wanted)
+
+    def has_history(self, *conditions, require_all=False):
+        """Mask of patients with any (or all) of the given medical_history items."""
+        bits = np.uint8(sum(HISTORY_BITS[c] for c in conditions))
+        hits = self.columns["medical_history"] & bits
+        return hits == bits if require_all else hits != 0
+
+    def dates(self, col):
+        """A date column as datetime64[D]."""
+        return self.columns[col].astype("datetime64[D]")
+
+    # ---- export ----
+    def decode(self, col):
+        """One SCHEMA field as export-ready values (strings / rounded numbers)."""
+        if col == "patient_id":
+            return np.char.add("P", self.columns["patient_num"].astype(str)).astype(object)
+        if col == "name":
+            first = np.asarray(self.categories["first_name"], dtype=object)[self.columns["first_name"]]
+            last = np.asarray(self.categories["last_name"], dtype=object)[self.columns["last_name"]]
+            return np.char.strip(np.char.add(np.char.add(first.astype(str), " "), last.astype(str))).astype(object)
+        if col in DATE_COLUMNS:
+            return decode_dates(self.columns[col])
+        if col == "medical_history":
+            return HISTORY_TEXT[self.columns[col]]
+        if col in self.categories:
+            return np.asarray(self.categories[col], dtype=object)[self.columns[col]]
+        if col in DECIMALS:
+            return np.round(self.columns[col].astype(np.float64), DECIMALS[col])
+        return self.columns[col].astype(np.int64)
+
+    def to_dataframe(self):
+        return pd.DataFrame({col: self.decode(col) for col in SCHEMA})
+
+    def to_records(self):
+        """Back to the dataset_20 list-of-dicts schema (plain Python types, JSON-ready)."""
+        values = [self.decode(col).tolist() for col in SCHEMA]
+        return [dict(zip(SCHEMA, row)) for row in zip(*values)]
+
+    def iter_chunks(self, chunk_size=None):
+        """
+        Zero-copy slices of at most chunk_size rows (default dataset_20.SAVE_CHUNK_SIZE).
+        An empty cohort yields one empty slice, so writers still emit a header.
+        """
+        chunk_size = chunk_size or ds.SAVE_CHUNK_SIZE
+        for start in range(0, max(len(self), 1), chunk_size):
+            yield self[start:start + chunk_size]
+
+    def save(self, path, fmt=None):
+        """
+        Write JSON / CSV / Parquet in the same schema as dataset_20's output files,
+        decoding one chunk of rows at a time.
+        """
+        fmt = fmt or path.rsplit(".", 1)[-1].lower()
+        if fmt == "json":
+            ds.save_json(itertools.chain.from_iterable(c.to_records() for c in self.iter_chunks()), path)
+        elif fmt == "csv":
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                for i, chunk in enumerate(self.iter_chunks()):
+                    chunk.to_dataframe().to_csv(f, index=False, header=(i == 0))
+        elif fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            writer = None
+            try:
+                for chunk in self.iter_chunks():
+                    table = pa.Table.from_pandas(chunk.to_dataframe(), preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+        else:
+            raise ValueError(f"unsupported format: {fmt}")
+
+
+# -----------------------------
+# 3) LAZY (VIRTUAL) COHORT
+# -----------------------------
+class LazyCohort:
+    """
+    Virtual cohort of patient indices `indices` (a range); nothing is stored.
+    Patient i is rebuilt from (root_seed, i, today) on every access, so the same
+    index always yields the same record. `today` (default dataset_20.TODAY) is fixed
+    when the cohort is created; pass a date for fixtures that are stable across days.
+    """
+
+    def __init__(self, n_patients=None, root_seed=ds.ROOT_SEED, ref_df=None, indices=None, today=None):
+        self.indices = range(n_patients) if indices is None else indices
+        self.root_seed = root_seed
+        self.ref_df = ref_df
+        self.today = ds.reference_day(today)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        """cohort[i] -> patient dict; cohort[a:b:c] -> LazyCohort over that sub-range."""
+        if isinstance(key, slice):
+            return LazyCohort(root_seed=self.root_seed, ref_df=self.ref_df,
+                              indices=self.indices[key], today=self.today)
+        return ds.gen_patient_at(self.indices[key], self.root_seed, self.ref_df, self.today)
+
+    def __iter__(self):
+        for index in self.indices:
+            yield ds.gen_patient_at(index, self.root_seed, self.ref_df, self.today)
+
+    def __contains__(self, patient_id):
+        try:
+            return ds.patient_index(patient_id) in self.indices
+        except ValueError:
+            return False
+
+    def __repr__(self):
+        return f"LazyCohort({len(self)} patients, root_seed={self.root_seed})"
+
+    def get(self, patient_id):
+        """Patient dict for a patient_id such as 'P2000123' (KeyError if outside this cohort)."""
+        if patient_id not in self:
+            raise KeyError(patient_id)
+        return ds.gen_patient_at(ds.patient_index(patient_id), self.root_seed, self.ref_df, self.today)
+
+    def to_cohort(self, chunk_size=100_000):
+        """Materialize into a columnar Cohort, chunk_size patients at a time."""
+        records = iter(self)
+        chunks = []
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            chunks.append(Cohort.from_records(chunk))
+        return Cohort.concat(chunks) if chunks else Cohort.from_records([])
@@ -0,0 +1,302 @@
+"""
+cohort_store.py
+---------------
+Grow a synthetic cohort incrementally instead of regenerating it.
+
+A store is a directory with partition files plus a manifest.json:
+
+    {"version": 2, "root_seed": 7, "id_offset": 2000, "format": "json",
+     "today": "2026-01-15", "ref_csv": null,
+     "next_index": 30000,
+     "partitions": [{"file": "part-0000000000-0000020000.json", "start": 0, "count": 20000},
+                    {"file": "part-0000020000-0000030000.json", "start": 20000, "count": 10000}]}
+
+- grow(M) generates patients next_index .. next_index+M-1 with per-patient RNG
+  streams (dataset_20.gen_patient_at), so IDs continue the P{2000+i} sequence,
+  existing patients never change, and the cost is O(M) whatever the cohort size.
+  The new patients are streamed to new partition file(s); existing partitions are
+  not touched.
+- Everything a record depends on is fixed at init and read back on every grow:
+  root_seed, the reference date dob/hba1c_date count back from ("today"), and the
+  optional BRFSS reference CSV (path + sha256; grow fails if it is gone or changed).
+- compact() merges runs of adjacent small partitions into one file; only those
+  partitions are rewritten.
+- An existing single-file cohort (e.g. patient_dataset_20.json) can be adopted as
+  the first partition; growth then continues after its last patient.
+
+The manifest is replaced atomically after the data files are written, so an
+interrupted grow/compact leaves at worst an unreferenced file behind.
+
+Run:
+    python data/cohort_store.py init  cohort_store --from data/patient_dataset_20.json --today 2026-01-15
+    python data/cohort_store.py grow  cohort_store -m 10000
+    python data/cohort_store.py compact cohort_store --min-rows 100000
+    python data/cohort_store.py info  cohort_store
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import dataset_20 as ds
+
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+DEFAULT_MIN_ROWS = 100_000
+
+
+# -----------------------------
+# 1) MANIFEST
+# -----------------------------
+def manifest_path(store_dir):
+    return os.path.join(store_dir, MANIFEST_NAME)
+
+
+def load_manifest(store_dir):
+    with open(manifest_path(store_dir), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{store_dir}: manifest version {manifest.get('version')}, expected {MANIFEST_VERSION}")
+    return manifest
+
+
+def write_manifest(store_dir, manifest):
+    """Write to a temp file and os.replace it, so readers never see a half-written manifest."""
+    tmp = manifest_path(store_dir) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(store_dir))
+
+
+def partition_name(start, count, fmt):
+    return f"part-{start:010d}-{start + count:010d}.{fmt}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_store_reference(manifest):
+    """The reference DataFrame recorded in the manifest (None if the store uses none)."""
+    ref = manifest["ref_csv"]
+    if ref is None:
+        return None
+    if not os.path.exists(ref["path"]):
+        raise FileNotFoundError(f"reference CSV recorded in the manifest is missing: {ref['path']}")
+    if file_sha256(ref["path"]) != ref["sha256"]:
+        raise ValueError(f"reference CSV changed since the store was created: {ref['path']}")
+    ref_df = ds.load_reference(ref["path"])
+    if ref_df is None:
+        raise ValueError(f"cannot read reference CSV: {ref['path']}")
+    return ref_df
+
+
+# -----------------------------
+# 2) PARTITION I/O
+# -----------------------------
+def read_partition(path):
+    """Load one partition file (json / csv / parquet) as a list of patient dicts."""
+    fmt = path.rsplit(".", 1)[-1].lower()
+    if fmt == "json":
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    if fmt == "csv":
+        return pd.read_csv(path, dtype={"diabetes_type": str}, keep_default_na=False).to_dict("records")
+    if fmt == "parquet":
+        return pd.read_parquet(path).to_dict("records")
+    raise ValueError(f"unsupported partition format: {path}")
+
+
+def write_partition(store_dir, patients, start, count, fmt):
+    """Write `count` patients (indices start.., any iterable) as a new partition; returns its manifest entry."""
+    name = partition_name(start, count, fmt)
+    tmp = os.path.join(store_dir, name + ".tmp")
+    ds.SAVERS[fmt](patients, tmp)
+    os.replace(tmp, os.path.join(store_dir, name))
+    return {"file": name, "start": start, "count": count}
+
+
+def iter_patients(store_dir):
+    """Yield every patient in ID order, one partition in memory at a time."""
+    for part in load_manifest(store_dir)["partitions"]:
+        yield from read_partition(os.path.join(store_dir, part["file"]))
+
+
+# -----------------------------
+# 3) INIT / GROW / COMPACT
+# -----------------------------
+def init_store(store_dir, root_seed=ds.ROOT_SEED, fmt="json", from_file=None, today=None, ref_csv=None):
+    """
+    Create an empty store. If from_file is given (an existing dataset_20 output),
+    it is copied in unchanged as the first partition and growth continues after it.
+    today (default: the current date) and ref_csv (default: no reference data) are
+    recorded and used by every later grow.
+    """
+    if fmt not in ds.SAVERS:
+        raise ValueError(f"unsupported format: {fmt}")
+    if os.path.exists(manifest_path(store_dir)):
+        raise FileExistsError(f"store already exists: {store_dir}")
+    ref = None
+    if ref_csv is not None:
+        if ds.load_reference(ref_csv) is None:
+            raise ValueError(f"cannot read reference CSV: {ref_csv}")
+        ref = {"path": os.path.abspath(ref_csv), "sha256": file_sha256(ref_csv)}
+    os.makedirs(store_dir, exist_ok=True)
+
+    partitions = []
+    if from_file is not None:
+        patients = read_partition(from_file)
+        indices = [ds.patient_index(p["patient_id"]) for p in patients]
+        if indices != list(range(len(patients))):
+            raise ValueError(f"{from_file}: patient_ids must run P{ds.ID_OFFSET}.. without gaps")
+        name = partition_name(0, len(patients), from_file.rsplit(".", 1)[-1].lower())
+        shutil.copyfile(from_file, os.path.join(store_dir, name))
+        partitions.append({"file": name, "start": 0, "count": len(patients)})
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "root_seed": root_seed,
+        "id_offset": ds.ID_OFFSET,
+        "format": fmt,
+        "today": ds.reference_day(today).date().isoformat(),
+        "ref_csv": ref,
+        "next_index": sum(p["count"] for p in partitions),
+        "partitions": partitions,
+    }
+    write_manifest(store_dir, manifest)
+    return manifest
+
+
+def _is_positive_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool) and value >= 1
+
+
+def grow(store_dir, n_new, partition_size=None):
+    """
+    Append n_new patients as new partition(s) of at most partition_size rows; O(n_new).
+    Patients are streamed to disk, and root_seed / today / ref_csv come from the manifest.
+    """
+    if not _is_positive_int(n_new):
+        raise ValueError(f"n_new must be a positive integer, got {n_new!r}")
+    if partition_size is None:
+        partition_size = n_new
+    elif not _is_positive_int(partition_size):
+        raise ValueError(f"partition_size must be a positive integer, got {partition_size!r}")
+    manifest = load_manifest(store_dir)
+    if manifest["id_offset"] != ds.ID_OFFSET:
+        raise ValueError(f"store uses id_offset {manifest['id_offset']}, dataset_20 uses {ds.ID_OFFSET}")
+    ref_df = load_store_reference(manifest)
+
+    start, stop = manifest["next_index"], manifest["next_index"] + n_new
+    new_parts = []
+    for chunk_start in range(start, stop, partition_size):
+        chunk_stop = min(chunk_start + partition_size, stop)
+        patients = ds.iter_patient_range(chunk_start, chunk_stop, manifest["root_seed"], ref_df, manifest["today"])
+        new_parts.append(write_partition(store_dir, patients, chunk_start, chunk_stop - chunk_start,
+                                         manifest["format"]))
+
+    manifest["partitions"].extend(new_parts)
+    manifest["next_index"] = stop
+    write_manifest(store_dir, manifest)
+    return new_parts
+
+
+def compact(store_dir, min_rows=DEFAULT_MIN_ROWS):
+    """
+    Merge each run of 2+ adjacent partitions smaller than min_rows into one partition
+    (merged runs stop growing once they reach min_rows). Larger partitions are left alone.
+    Returns the list of new manifest entries.
+    """
+    manifest = load_manifest(store_dir)
+    runs, current = [], []
+    for part in manifest["partitions"]:
+        if part["count"] < min_rows and sum(p["count"] for p in current) < min_rows:
+            current.append(part)
+            continue
+        runs.append(current)
+        current = [part] if part["count"] < min_rows else []
+    runs.append(current)
+    runs = [run for run in runs if len(run) > 1]
+    if not runs:
+        return []
+
+    replaced, merged = {}, []
+    for run in runs:
+        # one source partition in memory at a time
+        patients = itertools.chain.from_iterable(
+            read_partition(os.path.join(store_dir, part["file"])) for part in run)
+        entry = write_partition(store_dir, patients, run[0]["start"], sum(p["count"] for p in run),
+                                manifest["format"])
+        replaced[run[0]["file"]] = entry
+        replaced.update({part["file"]: None for part in run[1:]})
+        merged.append(entry)
+
+    old_files = [p["file"] for p in manifest["partitions"] if p["file"] in replaced]
+    manifest["partitions"] = [
+        replaced.get(p["file"], p) for p in manifest["partitions"]
+        if replaced.get(p["file"], p) is not None
+    ]
+    write_manifest(store_dir, manifest)
+    live = {p["file"] for p in manifest["partitions"]}
+    for name in old_files:
+        if name not in live:
+            os.remove(os.path.join(store_dir, name))
+    return merged
+
+
+# -----------------------------
+# 4) CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partitioned, append-only synthetic cohort store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="create a store")
+    p_init.add_argument("store")
+    p_init.add_argument("--format", choices=sorted(ds.SAVERS), default="json")
+    p_init.add_argument("--seed", type=int, default=ds.ROOT_SEED)
+    p_init.add_argument("--from", dest="from_file", help="adopt an existing dataset_20 JSON/CSV as partition 0")
+    p_init.add_argument("--today", help="reference date YYYY-MM-DD for dob/hba1c_date (default: current date)")
+    p_init.add_argument("--ref-csv", help="BRFSS reference CSV used by every grow (default: none)")
+
+    p_grow = sub.add_parser("grow", help="append M patients")
+    p_grow.add_argument("store")
+    p_grow.add_argument("-m", "--patients", type=int, required=True)
+    p_grow.add_argument("--partition-size", type=int, help="max rows per new partition (default: all in one)")
+
+    p_compact = sub.add_parser("compact", help="merge adjacent small partitions")
+    p_compact.add_argument("store")
+    p_compact.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS)
+
+    p_info = sub.add_parser("info", help="show the manifest summary")
+    p_info.add_argument("store")
+
+    args = parser.parse_args(argv)
+    if args.command == "init":
+        init_store(args.store, args.seed, args.format, args.from_file, args.today, args.ref_csv)
+    elif args.command == "grow":
+        for part in grow(args.store, args.patients, args.partition_size):
+            print(f"wrote {part['file']} ({part['count']} patients)")
+    elif args.command == "compact":
+        for part in compact(args.store, args.min_rows):
+            print(f"merged into {part['file']} ({part['count']} patients)")
+
+    manifest = load_manifest(args.store)
+    print(f"{args.store}: {manifest['next_index']} patients "
+          f"(P{manifest['id_offset']}..P{manifest['id_offset'] + manifest['next_index'] - 1}) "
+          f"in {len(manifest['partitions'])} partitions")
+
+
+if __name__ == "__main__":
+    main()
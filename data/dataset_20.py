@@ -29,6 +29,7 @@ Output files:
     JSON and CSV will be written to your OneDrive path (edit OUTPUT_DIR if needed).
 """
 
+import itertools
 import json
 import os
 from datetime import datetime, timedelta
@@ -52,16 +53,28 @@ REF_CSV = os.path.join(os.path.dirname(__file__), "diabetes_012_health_indicator
 # Number of patients to create
 N_PATIENTS = 20
 
+# patient_id = f"P{ID_OFFSET + index}"
+ID_OFFSET = 2000
+
 # Seed for reproducibility (change/remove if you want different samples each run)
-np.random.seed(7)
-random.seed(7)
+ROOT_SEED = 7
+np.random.seed(ROOT_SEED)
+random.seed(ROOT_SEED)
 
-TODAY = datetime.now()  # current date on your machine
+TODAY = datetime.now()  # current date on your machine; dates count back from it (see reference_day)
 
 
 # -----------------------------
 # 1) HELPER FUNCTIONS
 # -----------------------------
+def reference_day(today=None):
+    """Midnight of `today` (date / datetime / 'YYYY-MM-DD'; default TODAY): dates count back from it."""
+    today = TODAY if today is None else today
+    if isinstance(today, datetime):
+        return today.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return pd.Timestamp(today).normalize().to_pydatetime()
+
+
 def _normalize_probs(probs, n_needed):
     """
     Ensures a valid probability vector:
@@ -99,15 +112,15 @@ REGION_KEYS = list(FIRST_NAMES.keys())
 REGION_PROBS = _normalize_probs([0.33, 0.12, 0.12, 0.12, 0.11, 0.20], len(REGION_KEYS))
 
 
-def gen_name():
+def gen_name(rng=np.random, py_rng=random):
     """Create a full name by picking a region, then a first+last name from that region."""
-    region = np.random.choice(REGION_KEYS, p=REGION_PROBS)
-    first = random.choice(FIRST_NAMES[region])
-    last = random.choice(LAST_NAMES[region])
+    region = rng.choice(REGION_KEYS, p=REGION_PROBS)
+    first = py_rng.choice(FIRST_NAMES[region])
+    last = py_rng.choice(LAST_NAMES[region])
     return f"{first} {last}"
 
 
-def sample_age_from_brfss(age_code):
+def sample_age_from_brfss(age_code, rng=np.random):
     """
     BRFSS age bins (approx):
       1: 18-24, 2: 25-29, 3: 30-34, ... 12: 75-79, 13: 80-88
@@ -119,13 +132,13 @@ def sample_age_from_brfss(age_code):
         9: (60, 64), 10: (65, 69), 11: (70, 74), 12: (75, 79), 13: (80, 88),
     }
     lo, hi = mapping.get(int(age_code), (40, 70))
-    return int(np.random.randint(lo, hi + 1))
+    return int(rng.randint(lo, hi + 1))
 
 
-def make_dob(age_years):
+def make_dob(age_years, rng=np.random, today=None):
     """Create a realistic DOB given an age in years (spread birthdays through the year)."""
-    dob = TODAY.replace(hour=0, minute=0, second=0, microsecond=0) - pd.DateOffset(years=int(age_years))
-    dob = dob - pd.Timedelta(days=np.random.randint(0, 365))
+    dob = reference_day(today) - pd.DateOffset(years=int(age_years))
+    dob = dob - pd.Timedelta(days=rng.randint(0, 365))
     return dob.date()
 
 
@@ -134,42 +147,42 @@ def bmi_to_weight(bmi, height_cm):
     return float(bmi) * (float(height_cm) / 100.0) ** 2
 
 
-def gen_bp(high_bp_flag):
+def gen_bp(high_bp_flag, rng=np.random):
     """Generate systolic/diastolic BP; higher if 'high BP' flag is on."""
     if high_bp_flag == 1:
-        sys = int(np.random.normal(142, 12))
-        dia = int(np.random.normal(88, 8))
+        sys = int(rng.normal(142, 12))
+        dia = int(rng.normal(88, 8))
     else:
-        sys = int(np.random.normal(124, 10))
-        dia = int(np.random.normal(78, 7))
+        sys = int(rng.normal(124, 10))
+        dia = int(rng.normal(78, 7))
     return int(np.clip(sys, 95, 200)), int(np.clip(dia, 55, 120))
 
 
-def gen_hr(diabetes_type):
+def gen_hr(diabetes_type, rng=np.random):
     """Slightly higher resting HR in diabetes, with bounds."""
-    base = np.random.normal(74, 6)
+    base = rng.normal(74, 6)
     if diabetes_type in ["T1", "T2"]:
-        base += np.random.normal(2.5, 2.0)
+        base += rng.normal(2.5, 2.0)
     return int(np.clip(base, 50, 110))
 
 
-def pick_height_cm(sex):
+def pick_height_cm(sex, rng=np.random):
     """Simple sex-based height distributions."""
     if sex == "Female":
-        return int(np.clip(np.random.normal(162, 7), 145, 185))
+        return int(np.clip(rng.normal(162, 7), 145, 185))
     else:
-        return int(np.clip(np.random.normal(175, 8), 155, 200))
+        return int(np.clip(rng.normal(175, 8), 155, 200))
 
 
-def pick_bmi_from_brfss(df_row):
+def pick_bmi_from_brfss(df_row, rng=np.random):
     """
     If reference row has a BMI value, nudge around it.
     Else use a general distribution centered ~30.
     """
     if df_row is not None and "BMI" in df_row:
         base = float(df_row["BMI"])
-        return float(np.clip(np.random.normal(base, 1.6), 17.0, 55.0))
-    return float(np.clip(np.random.normal(29.5, 5.0), 17.0, 55.0))
+        return float(np.clip(rng.normal(base, 1.6), 17.0, 55.0))
+    return float(np.clip(rng.normal(29.5, 5.0), 17.0, 55.0))
 
 
 def brfss_to_sex(sex_flag):
@@ -179,7 +192,7 @@ def brfss_to_sex(sex_flag):
     return "Male" if int(sex_flag) == 1 else "Female"
 
 
-def get_flag(row, colname, default_prob=0.5):
+def get_flag(row, colname, default_prob=0.5, rng=np.random):
     """
     Try to read a 0/1 flag from the reference row.
     If not available, sample 1 with probability default_prob.
@@ -189,10 +202,10 @@ def get_flag(row, colname, default_prob=0.5):
             return int(row[colname])
         except Exception:
             pass
-    return 1 if np.random.rand() < default_prob else 0
+    return 1 if rng.rand() < default_prob else 0
 
 
-def infer_sex_flag(row):
+def infer_sex_flag(row, rng=np.random):
     """Guess a sex flag (1/2) from reference; otherwise sample ~48% male."""
     if row is not None:
         for cand in ["Sex", "sex", "male", "gender"]:
@@ -201,10 +214,10 @@ def infer_sex_flag(row):
                     return int(row[cand])
                 except Exception:
                     pass
-    return 1 if np.random.rand() < 0.48 else 2
+    return 1 if rng.rand() < 0.48 else 2
 
 
-def infer_age_code(row):
+def infer_age_code(row, rng=np.random):
     """
     If a usable age/age-category exists in the reference row, use it.
     Otherwise sample from bins 6..12 (skew older for diabetes realism).
@@ -229,7 +242,7 @@ def infer_age_code(row):
     # fallback: bins 6..12 inclusive (7 bins). Slightly older skew.
     bins = list(range(6, 13))
     probs = _normalize_probs([0.06, 0.12, 0.16, 0.18, 0.18, 0.14, 0.16], len(bins))
-    return int(np.random.choice(bins, p=probs))
+    return int(rng.choice(bins, p=probs))
 
 
 # ---- Medical history & medications ----
@@ -239,7 +252,7 @@ MED_HISTORY_OPTIONS = [
 ]
 
 
-def pick_med_history(diabetes_type, age):
+def pick_med_history(diabetes_type, age, rng=np.random):
     """
     Choose 0..many medical history items with probabilities that
     increase with diabetes and with age (for vascular outcomes).
@@ -269,18 +282,18 @@ def pick_med_history(diabetes_type, age):
             "history of diabetic foot ulcer or amputation": 0.0,
         })
 
-    chosen = [cond for cond, p in probs.items() if np.random.rand() < np.clip(p, 0, 0.95)]
+    chosen = [cond for cond, p in probs.items() if rng.rand() < np.clip(p, 0, 0.95)]
     return "none" if len(chosen) == 0 else "; ".join(sorted(set(chosen)))
 
 
-def pick_medication(diabetes_type):
+def pick_medication(diabetes_type, rng=np.random):
     """
     Allowed set: none | Metformin | sitagliptin
     - T2 tends to use Metformin most.
     - T1 and non-diabetics -> "none" (since insulin wasn’t an allowed option).
     """
     if diabetes_type == "T2":
-        return str(np.random.choice(["none", "Metformin", "sitagliptin"], p=_normalize_probs([0.2, 0.65, 0.15], 3)))
+        return str(rng.choice(["none", "Metformin", "sitagliptin"], p=_normalize_probs([0.2, 0.65, 0.15], 3)))
     elif diabetes_type == "T1":
         return "none"
     else:
@@ -288,36 +301,36 @@ def pick_medication(diabetes_type):
 
 
 # ---- Lifestyle helpers ----
-def pick_smoking(smoker_flag):
-    return "current" if smoker_flag == 1 else str(np.random.choice(["never", "former"], p=_normalize_probs([0.7, 0.3], 2)))
+def pick_smoking(smoker_flag, rng=np.random):
+    return "current" if smoker_flag == 1 else str(rng.choice(["never", "former"], p=_normalize_probs([0.7, 0.3], 2)))
 
 
-def pick_alcohol(heavy_flag):
-    return "heavy" if heavy_flag == 1 else str(np.random.choice(["none", "moderate"], p=_normalize_probs([0.35, 0.65], 2)))
+def pick_alcohol(heavy_flag, rng=np.random):
+    return "heavy" if heavy_flag == 1 else str(rng.choice(["none", "moderate"], p=_normalize_probs([0.35, 0.65], 2)))
 
 
-def pick_activity(phys_activity_flag):
-    return "low" if phys_activity_flag == 0 else str(np.random.choice(["moderate", "high"], p=_normalize_probs([0.7, 0.3], 2)))
+def pick_activity(phys_activity_flag, rng=np.random):
+    return "low" if phys_activity_flag == 0 else str(rng.choice(["moderate", "high"], p=_normalize_probs([0.7, 0.3], 2)))
 
 
-def pick_diet_pattern():
-    return str(np.random.choice(
+def pick_diet_pattern(rng=np.random):
+    return str(rng.choice(
         ["traditional", "high refined carbs", "Mediterranean-like", "vegetarian", "mixed/Western"],
         p=_normalize_probs([0.30, 0.22, 0.22, 0.10, 0.16], 5),
     ))
 
 
-def pick_family_history(diabetes_type):
-    return str(np.random.choice(["yes", "no"], p=_normalize_probs([0.62, 0.38], 2))) if diabetes_type in ["T1", "T2"] \
-        else str(np.random.choice(["yes", "no"], p=_normalize_probs([0.25, 0.75], 2)))
+def pick_family_history(diabetes_type, rng=np.random):
+    return str(rng.choice(["yes", "no"], p=_normalize_probs([0.62, 0.38], 2))) if diabetes_type in ["T1", "T2"] \
+        else str(rng.choice(["yes", "no"], p=_normalize_probs([0.25, 0.75], 2)))
 
 
-def pick_allergies():
-    return str(np.random.choice(["yes", "no"], p=_normalize_probs([0.18, 0.82], 2)))
+def pick_allergies(rng=np.random):
+    return str(rng.choice(["yes", "no"], p=_normalize_probs([0.18, 0.82], 2)))
 
 
 # ---- Glucose & HbA1c with dependencies and category guidance ----
-def gen_glucose_and_hba1c(diabetes_type, years_since_dx, bmi, weight_kg, alcohol_use):
+def gen_glucose_and_hba1c(diabetes_type, years_since_dx, bmi, weight_kg, alcohol_use, rng=np.random, today=None):
     """
     Build FPG/PPG/HbA1c with realistic relationships:
     - Base by type
@@ -339,9 +352,9 @@ def gen_glucose_and_hba1c(diabetes_type, years_since_dx, bmi, weight_kg, alcohol
         fpg_mu, ppg_mu, a1c_mu = 132, 185, 7.2
         fpg_sd, ppg_sd, a1c_sd = 22, 30, 0.7
 
-    fpg = np.random.normal(fpg_mu, fpg_sd)
-    ppg = np.random.normal(ppg_mu, ppg_sd)
-    a1c = np.random.normal(a1c_mu, a1c_sd)
+    fpg = rng.normal(fpg_mu, fpg_sd)
+    ppg = rng.normal(ppg_mu, ppg_sd)
+    a1c = rng.normal(a1c_mu, a1c_sd)
 
     # BMI/weight effects (small but directional)
     a1c += 0.03 * max(bmi - 25, 0)               # ~+0.3 per +10 BMI over 25
@@ -351,129 +364,132 @@ def gen_glucose_and_hba1c(diabetes_type, years_since_dx, bmi, weight_kg, alcohol
 
     # Treatment effect with time (some patients improve with care)
     if diabetes_type in ["T1", "T2"] and years_since_dx is not None:
-        a1c -= np.clip(np.random.normal(0.02 * years_since_dx, 0.1), -0.5, 0.8)
+        a1c -= np.clip(rng.normal(0.02 * years_since_dx, 0.1), -0.5, 0.8)
 
     # Alcohol effect
     if alcohol_use == "heavy":
         if diabetes_type in ["T1", "T2"]:
             # Encourage A1c > 6 in diabetics with heavy alcohol use
-            a1c = max(a1c, np.random.normal(6.4, 0.4))
-            fpg += np.random.normal(4, 6)
-            ppg += np.random.normal(6, 8)
+            a1c = max(a1c, rng.normal(6.4, 0.4))
+            fpg += rng.normal(4, 6)
+            ppg += rng.normal(6, 8)
         else:
             # Non-diabetic heavy drinkers: small bump but often <6
-            a1c += np.random.normal(0.2, 0.15)
-            a1c = min(a1c, np.random.normal(5.9, 0.15))
+            a1c += rng.normal(0.2, 0.15)
+            a1c = min(a1c, rng.normal(5.9, 0.15))
 
     # ---- Nudge toward clinical ranges you provided ----
     if diabetes_type == "0":
         # Mostly Normal/Prediabetes; rarely ≥6.5
-        if a1c >= 6.5 and np.random.rand() < 0.8:
-            a1c = np.random.uniform(5.5, 6.3)
+        if a1c >= 6.5 and rng.rand() < 0.8:
+            a1c = rng.uniform(5.5, 6.3)
     else:
         # For diabetics, ensure many are ≥6.5, but allow well-controlled cases
-        if a1c < 6.5 and np.random.rand() < 0.7:
-            a1c = np.random.uniform(6.5, 8.2)
+        if a1c < 6.5 and rng.rand() < 0.7:
+            a1c = rng.uniform(6.5, 8.2)
 
     # Clamp and round
     fpg = float(np.clip(fpg, 65, 350))
     ppg = float(np.clip(ppg, 80, 450))
     a1c = float(np.clip(a1c, 4.5, 14.0))
 
-    a1c_date = (TODAY - timedelta(days=int(np.random.randint(1, 181)))).date()
+    a1c_date = (reference_day(today) - timedelta(days=int(rng.randint(1, 181)))).date()
     return round(fpg, 1), round(ppg, 1), round(a1c, 2), str(a1c_date)
 
 
 # -----------------------------
 # 2) REFERENCE DATA (optional)
 # -----------------------------
-ref_df = None
-if os.path.exists(REF_CSV):
+def load_reference(path=REF_CSV):
+    """Load the optional BRFSS reference CSV; returns None if missing or unreadable."""
+    if path is None or not os.path.exists(path):
+        return None
     try:
-        ref_df = pd.read_csv(REF_CSV)
+        return pd.read_csv(path)
     except Exception:
-        ref_df = None
-
-ref_subset = ref_df.copy() if ref_df is not None else None
+        return None
 
 
 # -----------------------------
 # 3) PATIENT TYPE MIX
 # -----------------------------
-# ~10% T1, 75% T2, 15% non-diabetic "0"
-types = (["T1"] * int(round(0.10 * N_PATIENTS)) +
-         ["T2"] * int(round(0.75 * N_PATIENTS)) +
-         ["0"]  * (N_PATIENTS - int(round(0.10 * N_PATIENTS)) - int(round(0.75 * N_PATIENTS))))
-random.shuffle(types)
+def make_type_mix(n_patients):
+    """~10% T1, 75% T2, 15% non-diabetic "0", shuffled."""
+    n_t1 = int(round(0.10 * n_patients))
+    n_t2 = int(round(0.75 * n_patients))
+    types = ["T1"] * n_t1 + ["T2"] * n_t2 + ["0"] * (n_patients - n_t1 - n_t2)
+    random.shuffle(types)
+    return types
 
 
 # -----------------------------
 # 4) GENERATE PATIENTS
 # -----------------------------
-patients = []
-
-for i in range(N_PATIENTS):
-    # Pull a reference row if available (for BMI/flags)
-    row = ref_subset.sample(1).iloc[0] if (ref_subset is not None and len(ref_subset) > 0) else None
-
+def gen_patient(i, diabetes_type, row=None, rng=np.random, py_rng=random, today=None):
+    """
+    Build one patient record (29 keys) for index i; row is an optional reference row.
+    rng/py_rng default to the global np.random/random streams (see patient_rng for per-patient streams).
+    dob and hba1c_date count back from `today` (default TODAY).
+    """
+    today = reference_day(today)
     # Sex & age
-    sex_flag = infer_sex_flag(row)
+    sex_flag = infer_sex_flag(row, rng=rng)
     sex = brfss_to_sex(sex_flag)
-    age_code = infer_age_code(row)
-    age = sample_age_from_brfss(age_code)
-    dob = make_dob(age)
+    age_code = infer_age_code(row, rng=rng)
+    age = sample_age_from_brfss(age_code, rng=rng)
+    dob = make_dob(age, rng=rng, today=today)
 
     # Risk flags (if ref is missing, use defaults)
-    high_bp_flag   = get_flag(row, "HighBP",            0.55)
-    high_chol_flag = get_flag(row, "HighChol",          0.45)
-    smoker_flag    = get_flag(row, "Smoker",            0.18)
-    heavy_alc_flag = get_flag(row, "HvyAlcoholConsump", 0.06)
-    phys_act_flag  = get_flag(row, "PhysActivity",      0.55)
-
-    height_cm = pick_height_cm(sex)
-    bmi = pick_bmi_from_brfss(row)
+    high_bp_flag   = get_flag(row, "HighBP",            0.55, rng=rng)
+    high_chol_flag = get_flag(row, "HighChol",          0.45, rng=rng)
+    smoker_flag    = get_flag(row, "Smoker",            0.18, rng=rng)
+    heavy_alc_flag = get_flag(row, "HvyAlcoholConsump", 0.06, rng=rng)
+    phys_act_flag  = get_flag(row, "PhysActivity",      0.55, rng=rng)
+
+    height_cm = pick_height_cm(sex, rng=rng)
+    bmi = pick_bmi_from_brfss(row, rng=rng)
     weight_kg = round(float(np.clip(bmi_to_weight(bmi, height_cm), 40, 250)), 1)
 
-    sys_bp, dia_bp = gen_bp(high_bp_flag)
-    hr = gen_hr(types[i])
+    sys_bp, dia_bp = gen_bp(high_bp_flag, rng=rng)
+    hr = gen_hr(diabetes_type, rng=rng)
 
     # Years since diagnosis (0 for non-diabetic, right-skew for diabetics)
-    yrs_since_dx = 0 if types[i] == "0" else int(np.clip(np.random.exponential(scale=6.0), 0, 35))
+    yrs_since_dx = 0 if diabetes_type == "0" else int(np.clip(rng.exponential(scale=6.0), 0, 35))
 
     # Lifestyle
-    smoking = pick_smoking(smoker_flag)
-    alcohol = pick_alcohol(heavy_alc_flag)
-    activity = pick_activity(phys_act_flag)
-    diet = pick_diet_pattern()
-    fam_hist = pick_family_history(types[i])
-    allergies = pick_allergies()
+    smoking = pick_smoking(smoker_flag, rng=rng)
+    alcohol = pick_alcohol(heavy_alc_flag, rng=rng)
+    activity = pick_activity(phys_act_flag, rng=rng)
+    diet = pick_diet_pattern(rng=rng)
+    fam_hist = pick_family_history(diabetes_type, rng=rng)
+    allergies = pick_allergies(rng=rng)
 
     # Labs
-    fpg, ppg, hba1c, hba1c_date = gen_glucose_and_hba1c(types[i], yrs_since_dx, bmi, weight_kg, alcohol)
+    fpg, ppg, hba1c, hba1c_date = gen_glucose_and_hba1c(diabetes_type, yrs_since_dx, bmi, weight_kg, alcohol, rng=rng, today=today)
 
     # Lipids (simple model; bumped if high cholesterol and if diabetes)
-    base_tc = np.random.normal(195, 28) + (20 if high_chol_flag == 1 else 0)
-    base_ldl = np.random.normal(115, 24) + (18 if high_chol_flag == 1 else 0)
-    base_hdl = np.random.normal(49, 11) - (2 if high_chol_flag == 1 else 0)
-    base_tg  = np.random.normal(145, 50) + (25 if high_chol_flag == 1 else 0)
-    if types[i] in ["T1", "T2"]:
-        base_hdl += np.random.normal(-1, 2)
-        base_tg  += np.random.normal(15, 10)
+    base_tc = rng.normal(195, 28) + (20 if high_chol_flag == 1 else 0)
+    base_ldl = rng.normal(115, 24) + (18 if high_chol_flag == 1 else 0)
+    base_hdl = rng.normal(49, 11) - (2 if high_chol_flag == 1 else 0)
+    base_tg  = rng.normal(145, 50) + (25 if high_chol_flag == 1 else 0)
+    if diabetes_type in ["T1", "T2"]:
+        base_hdl += rng.normal(-1, 2)
+        base_tg  += rng.normal(15, 10)
     tc  = int(np.clip(round(base_tc), 110, 320))
     ldl = int(np.clip(round(base_ldl),  50, 220))
     hdl = int(np.clip(round(base_hdl),  25, 100))
     tg  = int(np.clip(round(base_tg),   45, 600))
 
-    med_history = pick_med_history(types[i], age)
-    medication  = pick_medication(types[i])
+    med_history = pick_med_history(diabetes_type, age, rng=rng)
+    medication  = pick_medication(diabetes_type, rng=rng)
 
-    patients.append({
-        "patient_id": f"P{2000 + i}",
-        "name": gen_name(),
+    return {
+        "patient_id": f"P{ID_OFFSET + i}",
+        "name": gen_name(rng=rng, py_rng=py_rng),
         "dob": str(dob),
         "age": int(age),
         "sex": sex,
-        "diabetes_type": types[i],                 # "0", "T1", or "T2"
+        "diabetes_type": diabetes_type,            # "0", "T1", or "T2"
         "years_since_diagnosis": int(yrs_since_dx),
         "height_cm": int(height_cm),
         "weight_kg": float(weight_kg),
@@ -497,33 +513,165 @@ for i in range(N_PATIENTS):
         "allergies": allergies,
         "medical_history": med_history,
         "ongoing_medications": medication,
-    })
+    }
+
+
+def iter_patients(n_patients, ref_df=None):
+    """Yield n_patients records one at a time, pulling a random reference row per patient if ref_df is given."""
+    types = make_type_mix(n_patients)
+    use_ref = ref_df is not None and len(ref_df) > 0
+
+    for i in range(n_patients):
+        # Pull a reference row if available (for BMI/flags)
+        row = ref_df.sample(1).iloc[0] if use_ref else None
+        yield gen_patient(i, types[i], row)
+
+
+def generate_patients(n_patients, ref_df=None):
+    """Generate n_patients records as a list of dicts."""
+    return list(iter_patients(n_patients, ref_df))
+
+
+# ---- Random access: one independent stream per patient ----
+# The sequential generator above shares one global stream, so patient i depends on
+# every draw before it. Here patient i's stream is derived from (root_seed, i) alone:
+# a Philox counter-based generator keyed by root_seed whose counter starts at i << 64.
+# Any patient (or ID range) can then be built on demand in O(1), in any order.
+# Diabetes type is drawn per patient with the same 10/75/15 mix instead of an exact
+# shuffled quota. Dates count back from `today`; pass a fixed date for records that
+# do not change from one day to the next.
+TYPE_KEYS = ["T1", "T2", "0"]
+TYPE_PROBS = _normalize_probs([0.10, 0.75, 0.15], len(TYPE_KEYS))
+
+
+class _ChoiceFromRng:
+    """random.choice stand-in drawing from a NumPy RandomState (keeps one stream per patient)."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choice(self, seq):
+        return seq[self.rng.randint(len(seq))]
+
+
+def patient_rng(index, root_seed=ROOT_SEED):
+    """RandomState for patient `index`; the same (root_seed, index) always gives the same stream."""
+    if index < 0:
+        raise ValueError(f"patient index must be >= 0, got {index}")
+    return np.random.RandomState(np.random.Philox(key=root_seed, counter=[0, index, 0, 0]))
+
+
+def gen_patient_at(index, root_seed=ROOT_SEED, ref_df=None, today=None):
+    """
+    Build patient `index` (patient_id P{ID_OFFSET + index}) without generating any other patient.
+    The record depends only on (root_seed, index, ref_df, today).
+    """
+    rng = patient_rng(index, root_seed)
+    diabetes_type = TYPE_KEYS[rng.choice(len(TYPE_KEYS), p=TYPE_PROBS)]
+    row = ref_df.iloc[rng.randint(len(ref_df))] if (ref_df is not None and len(ref_df) > 0) else None
+    return gen_patient(index, diabetes_type, row, rng=rng, py_rng=_ChoiceFromRng(rng), today=today)
+
+
+def iter_patient_range(start, stop, root_seed=ROOT_SEED, ref_df=None, today=None):
+    """Yield patients start..stop-1 (per-patient streams, so any range is independent of the rest)."""
+    today = reference_day(today)
+    for index in range(start, stop):
+        yield gen_patient_at(index, root_seed, ref_df, today)
+
+
+def patient_index(patient_id):
+    """'P2000123' -> 1998123 (inverse of the patient_id format)."""
+    if not (isinstance(patient_id, str) and patient_id[:1] == "P" and patient_id[1:].isdigit()):
+        raise ValueError(f"not a patient_id: {patient_id!r}")
+    index = int(patient_id[1:]) - ID_OFFSET
+    if index < 0:
+        raise ValueError(f"patient_id below P{ID_OFFSET}: {patient_id!r}")
+    return index
 
 
 # -----------------------------
 # 5) SAVE FILES
 # -----------------------------
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-json_path = os.path.join(OUTPUT_DIR, JSON_NAME)
-csv_path  = os.path.join(OUTPUT_DIR, CSV_NAME)
-
-with open(json_path, "w", encoding="utf-8") as f:
-    json.dump(patients, f, indent=2, ensure_ascii=False)
-
-df = pd.DataFrame(patients)
-df.to_csv(csv_path, index=False, encoding="utf-8")
-
-print("Files saved successfully!")
-print(f"JSON: {json_path}")
-print(f"CSV : {csv_path}")
-
-# Small sanity summary
-df["a1c_group"] = pd.cut(
-    df["hba1c_percent"],
-    bins=[-np.inf, 5.7, 6.4, np.inf],
-    labels=["Normal (<5.7)", "Prediabetes (5.7–6.4)", "Diabetes (≥6.5)"]
-)
-print("\nCounts by diabetes_type:")
-print(df["diabetes_type"].value_counts())
-print("\nCounts by HbA1c group:")
-print(df["a1c_group"].value_counts())
+# Savers accept a list or any iterable of patients (e.g. iter_patients) and write it
+# in chunks, so a cohort never has to be held in memory as one list of dicts.
+SAVE_CHUNK_SIZE = 100_000
+
+
+def _chunks(patients, chunk_size=None):
+    patients = iter(patients)
+    while True:
+        chunk = list(itertools.islice(patients, chunk_size or SAVE_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def save_json(patients, path):
+    """Same layout as json.dump(patients, indent=2), written one record at a time."""
+    with open(path, "w", encoding="utf-8") as f:
+        first = True
+        for p in patients:
+            f.write("[\n  " if first else ",\n  ")
+            f.write(json.dumps(p, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+            first = False
+        f.write("[]" if first else "\n]")
+
+
+def save_csv(patients, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(_chunks(patients)):
+            pd.DataFrame(chunk).to_csv(f, index=False, header=(i == 0))
+
+
+def save_parquet(patients, path):
+    """Needs pyarrow installed; each chunk becomes one row group."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in _chunks(patients):
+            table = pa.Table.from_pandas(pd.DataFrame(chunk), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+SAVERS = {"json": save_json, "csv": save_csv, "parquet": save_parquet}
+
+
+def print_summary(df):
+    """Small sanity summary: counts by diabetes type and HbA1c group."""
+    df = df.copy()
+    df["a1c_group"] = pd.cut(
+        df["hba1c_percent"],
+        bins=[-np.inf, 5.7, 6.4, np.inf],
+        labels=["Normal (<5.7)", "Prediabetes (5.7–6.4)", "Diabetes (≥6.5)"]
+    )
+    print("\nCounts by diabetes_type:")
+    print(df["diabetes_type"].value_counts())
+    print("\nCounts by HbA1c group:")
+    print(df["a1c_group"].value_counts())
+
+
+def main():
+    patients = generate_patients(N_PATIENTS, load_reference(REF_CSV))
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    json_path = os.path.join(OUTPUT_DIR, JSON_NAME)
+    csv_path  = os.path.join(OUTPUT_DIR, CSV_NAME)
+    save_json(patients, json_path)
+    save_csv(patients, csv_path)
+
+    print("Files saved successfully!")
+    print(f"JSON: {json_path}")
+    print(f"CSV : {csv_path}")
+
+    print_summary(pd.DataFrame(patients))
+
+
+if __name__ == "__main__":
+    main()
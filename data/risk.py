@@ -0,0 +1,270 @@
+"""
+risk.py
+-------
+Vectorized clinical risk scoring + "needs attention" index for the doctor dashboard.
+
+- Rules are plain dicts (so they can live in a JSON file):
+      {"name": "a1c_poor_control",
+       "when": [["diabetes_type", "in", ["T1", "T2"]], ["hba1c_percent", ">=", 9.0]],
+       "weight": 3.0,
+       "alert": "HbA1c {hba1c_percent}% - poor glycemic control"}
+  `when` conditions are ANDed; an optional `any` list is ORed (and ANDed with `when`).
+  `alert` is optional (defaults to the rule name) and may use any record field.
+  Condition ops: > >= < <= == != on numeric columns, "in" / "not in" on categorical
+  columns, and "history" on medical_history (any of the listed conditions).
+- RiskEngine evaluates every rule over a whole Cohort at once (one NumPy mask per
+  condition); a patient's score is the sum of the weights of the rules it fires.
+- RiskIndex keeps patients sorted by score. Top-K is a slice (O(K)); re-scoring or
+  appending m patients is a vectorized O(n + m log n) merge, not a full re-sort.
+- Alert strings (the app's Patient.recentAlerts) are only formatted for the rows
+  you ask about, e.g. the top K.
+
+Example:
+    from cohort import Cohort
+    from risk import RiskEngine
+    cohort = Cohort.from_file("patient_dataset_20.json")
+    engine = RiskEngine()
+    index = engine.build_index(cohort)
+    for p in engine.needs_attention(cohort, index, k=5):
+        print(p["patient_id"], p["risk_score"], p["recentAlerts"])
+"""
+
+import json
+import operator
+import string
+
+import numpy as np
+
+from cohort import SCHEMA
+
+
+# -----------------------------
+# 0) DEFAULT RULES
+# -----------------------------
+DIABETIC = ["diabetes_type", "in", ["T1", "T2"]]
+
+DEFAULT_RULES = [
+    {"name": "a1c_poor_control", "weight": 3.0,
+     "when": [DIABETIC, ["hba1c_percent", ">=", 9.0]],
+     "alert": "HbA1c {hba1c_percent}% - poor glycemic control"},
+    {"name": "a1c_above_target", "weight": 1.5,
+     "when": [DIABETIC, ["hba1c_percent", ">=", 8.0], ["hba1c_percent", "<", 9.0]],
+     "alert": "HbA1c {hba1c_percent}% - above target"},
+    {"name": "a1c_undiagnosed", "weight": 2.0,
+     "when": [["diabetes_type", "==", "0"], ["hba1c_percent", ">=", 6.5]],
+     "alert": "HbA1c {hba1c_percent}% without a diabetes diagnosis"},
+    {"name": "fasting_glucose_high", "weight": 2.0,
+     "when": [["fasting_glucose_mg_dL", ">=", 250]],
+     "alert": "Fasting glucose {fasting_glucose_mg_dL} mg/dL"},
+    {"name": "bp_severe", "weight": 3.0,
+     "any": [["systolic_bp", ">=", 180], ["diastolic_bp", ">=", 110]],
+     "alert": "Blood pressure {systolic_bp}/{diastolic_bp} - severely elevated"},
+    {"name": "bp_stage2", "weight": 1.5,
+     "when": [["systolic_bp", "<", 180], ["diastolic_bp", "<", 110]],
+     "any": [["systolic_bp", ">=", 140], ["diastolic_bp", ">=", 90]],
+     "alert": "Blood pressure {systolic_bp}/{diastolic_bp} - stage 2 hypertension"},
+    {"name": "ldl_high", "weight": 1.5,
+     "when": [["ldl_cholesterol_mg_dL", ">=", 160]],
+     "alert": "LDL {ldl_cholesterol_mg_dL} mg/dL"},
+    {"name": "cardiovascular_history", "weight": 2.0,
+     "when": [["medical_history", "history", ["stroke", "heart failure"]]],
+     "alert": "Cardiovascular history: {medical_history}"},
+    {"name": "diabetic_complications", "weight": 2.0,
+     "when": [["medical_history", "history", ["nephropathy", "history of diabetic foot ulcer or amputation"]]],
+     "alert": "Diabetic complications: {medical_history}"},
+    {"name": "t2_untreated", "weight": 1.5,
+     "when": [["diabetes_type", "==", "T2"], ["hba1c_percent", ">=", 7.0], ["ongoing_medications", "==", "none"]],
+     "alert": "T2 with HbA1c {hba1c_percent}% and no glucose-lowering medication"},
+    {"name": "severe_obesity", "weight": 1.0,
+     "when": [["BMI", ">=", 40]],
+     "alert": "BMI {BMI}"},
+    {"name": "diabetic_smoker", "weight": 1.0,
+     "when": [DIABETIC, ["smoking_status", "==", "current"]],
+     "alert": "Current smoker with diabetes"},
+]
+
+NUMERIC_OPS = {
+    ">": operator.gt, ">=": operator.ge,
+    "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+
+SET_OPS = ("in", "not in", "history")
+
+
+def load_rules(path):
+    """Read a rules list (same shape as DEFAULT_RULES) from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_rule(rule):
+    """Return a copy of `rule` with its alert defaulted to the name; ValueError if malformed."""
+    name = rule.get("name") if isinstance(rule, dict) else None
+    if not isinstance(name, str) or not name:
+        raise ValueError(f"rule needs a non-empty 'name': {rule!r}")
+    if not isinstance(rule.get("weight"), (int, float)) or isinstance(rule["weight"], bool):
+        raise ValueError(f"rule {name!r}: 'weight' must be a number")
+    if not rule.get("when") and not rule.get("any"):
+        raise ValueError(f"rule {name!r}: needs at least one 'when' or 'any' condition")
+    for cond in [*rule.get("when", []), *rule.get("any", [])]:
+        if not (isinstance(cond, (list, tuple)) and len(cond) == 3):
+            raise ValueError(f"rule {name!r}: condition must be [column, op, value], got {cond!r}")
+        col, op, value = cond
+        if col not in SCHEMA:
+            raise ValueError(f"rule {name!r}: unknown column {col!r}")
+        if op not in NUMERIC_OPS and op not in SET_OPS:
+            raise ValueError(f"rule {name!r}: unknown op {op!r}")
+        if op in SET_OPS and not isinstance(value, (list, tuple)):
+            raise ValueError(f"rule {name!r}: op {op!r} needs a list of values")
+    rule = dict(rule, alert=rule.get("alert", name))
+    fields = {field for _, field, _, _ in string.Formatter().parse(rule["alert"]) if field is not None}
+    if fields - set(SCHEMA):
+        raise ValueError(f"rule {name!r}: alert uses unknown fields {sorted(fields - set(SCHEMA))}")
+    return rule
+
+
+# -----------------------------
+# 1) RULE EVALUATION
+# -----------------------------
+def condition_mask(cohort, condition):
+    """Boolean mask over the cohort for one [column, op, value] condition."""
+    col, op, value = condition
+    if op == "history":
+        return cohort.has_history(*value)
+    if col in cohort.categories:
+        if op in ("in", "not in"):
+            mask = cohort.isin(col, value)
+        elif op in ("==", "!="):
+            mask = cohort.isin(col, [value])
+        else:
+            raise ValueError(f"op {op!r} is not valid for categorical column {col!r}")
+        return ~mask if op in ("not in", "!=") else mask
+    if op not in NUMERIC_OPS:
+        raise ValueError(f"unknown op {op!r} for column {col!r}")
+    return NUMERIC_OPS[op](cohort[col], value)
+
+
+def rule_mask(cohort, rule):
+    """Mask of patients firing one rule: all of `when` and, if given, any of `any`."""
+    mask = np.ones(len(cohort), dtype=bool)
+    for cond in rule.get("when", []):
+        mask &= condition_mask(cohort, cond)
+    if rule.get("any"):
+        any_mask = np.zeros(len(cohort), dtype=bool)
+        for cond in rule["any"]:
+            any_mask |= condition_mask(cohort, cond)
+        mask &= any_mask
+    return mask
+
+
+class RiskEngine:
+    """Evaluates a list of rules over Cohorts (see module docstring for the rule format)."""
+
+    def __init__(self, rules=None):
+        self.rules = [check_rule(rule) for rule in (DEFAULT_RULES if rules is None else rules)]
+        self.weights = np.array([r["weight"] for r in self.rules], dtype=np.float32)
+
+    def fired(self, cohort):
+        """(n_rules, n_patients) boolean matrix."""
+        out = np.empty((len(self.rules), len(cohort)), dtype=bool)
+        for i, rule in enumerate(self.rules):
+            out[i] = rule_mask(cohort, rule)
+        return out
+
+    def score(self, cohort):
+        """float32 risk score per patient (sum of fired rule weights)."""
+        scores = np.zeros(len(cohort), dtype=np.float32)
+        for rule, weight in zip(self.rules, self.weights):
+            scores[rule_mask(cohort, rule)] += weight
+        return scores
+
+    def alerts(self, cohort, positions):
+        """Alert strings (Patient.recentAlerts) for the given row positions, highest weight first."""
+        sub = cohort[np.asarray(positions, dtype=np.int64)]
+        fired = self.fired(sub)
+        by_weight = np.argsort(-self.weights, kind="stable")
+        out = []
+        for j, record in enumerate(sub.to_records()):
+            out.append([self.rules[i]["alert"].format(**record) for i in by_weight if fired[i, j]])
+        return out
+
+    def build_index(self, cohort):
+        return RiskIndex(self.score(cohort))
+
+    def refresh(self, cohort, index, positions):
+        """Re-score the given rows (e.g. after new labs came in) and move them in the index."""
+        positions = np.asarray(positions, dtype=np.int64)
+        index.update(positions, self.score(cohort[positions]))
+
+    def needs_attention(self, cohort, index, k=10, min_score=0.0):
+        """Top-k patients by risk as dashboard-ready dicts."""
+        positions, scores = index.top_k(k)
+        keep = scores > min_score
+        positions, scores = positions[keep], scores[keep]
+        top = cohort[positions]
+        return [
+            {"patient_id": pid, "name": name, "risk_score": float(score), "recentAlerts": alerts}
+            for pid, name, score, alerts in zip(
+                top.decode("patient_id"), top.decode("name"), scores, self.alerts(cohort, positions))
+        ]
+
+
+# -----------------------------
+# 2) SORTED RISK INDEX
+# -----------------------------
+class RiskIndex:
+    """
+    Row positions sorted by descending score (ties keep insertion order).
+
+    `scores[pos]` is the current score of row `pos`; `order` lists positions from
+    highest to lowest risk and `keys` holds the matching negated scores (ascending,
+    so np.searchsorted can be used directly).
+    """
+
+    def __init__(self, scores):
+        self.scores = np.array(scores, dtype=np.float32)
+        self.order = np.argsort(-self.scores, kind="stable")
+        self.keys = -self.scores[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def top_k(self, k):
+        """(positions, scores) of the k highest-risk patients."""
+        return self.order[:k], -self.keys[:k]
+
+    def at_least(self, threshold):
+        """Positions of all patients with score >= threshold, highest first."""
+        return self.order[:np.searchsorted(self.keys, -threshold, side="right")]
+
+    def update(self, positions, scores):
+        """
+        Set new scores for existing positions and re-insert them in order.
+        A position listed more than once takes its last score.
+        """
+        positions = np.asarray(positions, dtype=np.int64).ravel()
+        scores = np.broadcast_to(np.asarray(scores, dtype=np.float32), positions.shape)
+        if len(positions) and (positions.min() < 0 or positions.max() >= len(self.scores)):
+            raise IndexError(f"positions must be in 0..{len(self.scores) - 1}")
+        positions, last = np.unique(positions[::-1], return_index=True)
+        scores = scores[::-1][last]
+        keep = ~np.isin(self.order, positions)
+        self.order, self.keys = self.order[keep], self.keys[keep]
+        self.scores[positions] = scores
+        self._insert(positions, scores)
+
+    def append(self, scores):
+        """Add scores for new rows len(scores_before) ... (e.g. after Cohort.concat)."""
+        scores = np.asarray(scores, dtype=np.float32)
+        positions = np.arange(len(self.scores), len(self.scores) + len(scores))
+        self.scores = np.concatenate([self.scores, scores])
+        self._insert(positions, scores)
+
+    def _insert(self, positions, scores):
+        by_score = np.argsort(-scores, kind="stable")
+        positions, keys = positions[by_score], -scores[by_score]
+        at = np.searchsorted(self.keys, keys, side="right")
+        self.order = np.insert(self.order, at, positions)
+        self.keys = np.insert(self.keys, at, keys)
@@ -0,0 +1,464 @@
+"""
+Tests for the synthetic data pipeline in data/ (run: python -m pytest data).
+"""
+
+import json
+import multiprocessing as mp
+import os
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+import bench_dataset_20 as bench
+import cohort_store as store
+import dataset_20 as ds
+import validate_cohort as vc
+from cohort import SCHEMA, Cohort, LazyCohort, encode_categorical
+from risk import DEFAULT_RULES, RiskEngine, RiskIndex, load_rules
+
+
+def _records(n=30, start=0):
+    return list(ds.iter_patient_range(start, start + n))
+
+
+# -----------------------------
+# dataset_20 savers / bench
+# -----------------------------
+def test_save_json_streams_same_layout_as_json_dump(tmp_path):
+    patients = _records(5)
+    ds.save_json(iter(patients), tmp_path / "p.json")
+    assert (tmp_path / "p.json").read_text(encoding="utf-8") == json.dumps(patients, indent=2, ensure_ascii=False)
+
+    ds.save_json(iter([]), tmp_path / "empty.json")
+    assert json.loads((tmp_path / "empty.json").read_text(encoding="utf-8")) == []
+
+
+def test_save_csv_across_chunks_matches_single_dataframe(tmp_path, monkeypatch):
+    monkeypatch.setattr(ds, "SAVE_CHUNK_SIZE", 7)
+    patients = _records(20)
+    ds.save_csv(iter(patients), tmp_path / "chunked.csv")
+    pd.DataFrame(patients).to_csv(tmp_path / "whole.csv", index=False)
+    assert (tmp_path / "chunked.csv").read_text(encoding="utf-8") == (tmp_path / "whole.csv").read_text(encoding="utf-8")
+
+
+def test_wait_for_result_reports_dead_child_instead_of_hanging():
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=os._exit, args=(3,))
+    proc.start()
+    res = bench._wait_for_result(proc, queue, poll_seconds=0.2)
+    proc.join()
+    assert res == {"error": "child process exited with code 3"}
+
+
+def test_compare_flags_slowdowns_and_new_failures():
+    baseline = {"a": {"patients_per_sec": 100.0}, "b": {"peak_rss_mb": 50.0}, "c": {"patients_per_sec": 1.0}}
+    current = {"a": {"patients_per_sec": 80.0}, "b": {"peak_rss_mb": 52.0}, "c": {"error": "boom"}}
+    flagged = {(key, metric) for key, metric, *_ in bench.compare(baseline, current, 0.10)}
+    assert flagged == {("a", "patients_per_sec"), ("c", "error")}
+
+
+def test_compare_reports_baseline_cases_missing_from_the_run():
+    baseline = {"e2e/n=1000/fmt=json": {"patients_per_sec": 1.0}, "e2e/n=1000000/fmt=json": {"patients_per_sec": 1.0},
+                "risk/n=100000": {"score_ms": 10.0}}
+    current = {"e2e/n=1000/fmt=json": {"patients_per_sec": 1.0}}
+    assert bench.compare(baseline, current, 0.10) == [
+        ("e2e/n=1000000/fmt=json", "missing", None, None, None), ("risk/n=100000", "missing", None, None, None)]
+    assert bench.compare(baseline, current, 0.10, levels=["e2e"]) == [
+        ("e2e/n=1000000/fmt=json", "missing", None, None, None)]
+
+
+# -----------------------------
+# dataset_20 per-patient streams / LazyCohort
+# -----------------------------
+def test_gen_patient_at_depends_only_on_seed_index_and_today():
+    a = ds.gen_patient_at(123, today="2026-01-15")
+    assert a == ds.gen_patient_at(123, today=date(2026, 1, 15)) == ds.gen_patient_at(123, today=datetime(2026, 1, 15, 18))
+    assert list(ds.iter_patient_range(120, 125, today="2026-01-15"))[3] == a
+    b = ds.gen_patient_at(123, today="2026-03-01")
+    assert {k for k in a if a[k] != b[k]} <= {"dob", "hba1c_date"}
+    assert (date.fromisoformat(b["hba1c_date"]) - date.fromisoformat(a["hba1c_date"])).days == 45
+    assert ds.gen_patient_at(124, root_seed=8, today="2026-01-15") != ds.gen_patient_at(124, today="2026-01-15")
+
+
+def test_negative_indices_and_ids_below_offset_are_rejected():
+    with pytest.raises(ValueError):
+        ds.gen_patient_at(-1)
+    with pytest.raises(ValueError):
+        next(ds.iter_patient_range(-1, 3))
+    with pytest.raises(ValueError):
+        ds.patient_index("P0")
+    assert ds.patient_index("P2000") == 0 and "P1999" not in LazyCohort(10)
+
+
+def test_lazy_cohort_random_access_is_stable():
+    lazy = LazyCohort(1_000_000, today="2026-01-15")
+    patient = lazy.get("P1000123")
+    assert patient == lazy[998_123] == ds.gen_patient_at(998_123, today="2026-01-15")
+    assert lazy[-1] == lazy.get("P1001999")
+    sub = lazy[10:20]
+    assert sub.today == lazy.today
+    assert sub.to_cohort().to_records() == list(sub) == list(ds.iter_patient_range(10, 20, today="2026-01-15"))
+    assert "P1999" not in lazy and "P1002000" not in lazy and "P1001999" in lazy
+    with pytest.raises(KeyError):
+        lazy.get("P1002000")
+
+
+# -----------------------------
+# cohort.Cohort
+# -----------------------------
+def test_cohort_export_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(ds, "SAVE_CHUNK_SIZE", 7)
+    patients = _records(40)
+    cohort = Cohort.from_records(patients)
+    assert cohort.to_records() == patients
+    assert cohort[3] == patients[3] and cohort[-1] == patients[-1]
+    assert cohort[10:20].to_records() == patients[10:20]
+    assert np.shares_memory(cohort[10:20]["hba1c_percent"], cohort["hba1c_percent"])
+
+    cohort.save(str(tmp_path / "c.json"))
+    cohort.save(str(tmp_path / "c.csv"))
+    assert Cohort.from_file(str(tmp_path / "c.json")).to_records() == patients
+    assert Cohort.from_file(str(tmp_path / "c.csv")).to_records() == patients
+    assert (tmp_path / "c.json").read_text(encoding="utf-8") == json.dumps(patients, indent=2, ensure_ascii=False)
+    pd.DataFrame(patients).to_csv(tmp_path / "whole.csv", index=False)
+    assert (tmp_path / "c.csv").read_text(encoding="utf-8") == (tmp_path / "whole.csv").read_text(encoding="utf-8")
+
+
+def test_cohort_wide_ids_and_many_categories_do_not_wrap():
+    patients = _records(3)
+    patients[1]["patient_id"] = "P3000000000"
+    cohort = Cohort.from_records(patients)
+    assert cohort["patient_num"].dtype == np.int64
+    assert cohort.to_records() == patients
+    assert Cohort.from_records(_records(3))["patient_num"].dtype == np.int32
+    with pytest.raises(ValueError):
+        Cohort.from_records([dict(patients[0], patient_id="P" + "9" * 19)])
+
+    codes, cats = encode_categorical([f"n{i}" for i in range(70_000)])
+    assert codes.dtype == np.uint32 and codes[-1] == 69_999 and len(cats) == 70_000
+
+
+def test_cohort_filters_match_records():
+    patients = _records(200)
+    cohort = Cohort.from_records(patients)
+    mask = cohort.isin("diabetes_type", ["T2"]) & (cohort["hba1c_percent"] >= 8) & cohort.has_history("neuropathy")
+    expected = [p["patient_id"] for p in patients
+                if p["diabetes_type"] == "T2" and p["hba1c_percent"] >= 8 and "neuropathy" in p["medical_history"]]
+    assert [p["patient_id"] for p in cohort[mask].to_records()] == expected
+
+
+def test_cohort_concat_remaps_categories():
+    a = Cohort.from_records(_records(3))
+    b_records = _records(2, start=3)
+    b_records[0]["name"] = "Zed Unknownson"
+    b = Cohort.from_records(b_records)
+    assert Cohort.concat([a, b]).to_records() == a.to_records() + b_records
+
+
+def test_cohort_out_of_range_values_widen_instead_of_wrapping():
+    patients = _records(5)
+    patients[0].update(systolic_bp=260, age=-1)
+    cohort = Cohort.from_records(patients)
+    assert cohort[0]["systolic_bp"] == 260 and cohort[0]["age"] == -1
+    bp_severe = [r["name"] for r in RiskEngine().rules].index("bp_severe")
+    assert RiskEngine().fired(cohort)[bp_severe, 0]
+
+
+@pytest.mark.parametrize("bad", [None, "x", 3.5, float("nan")])
+def test_cohort_rejects_missing_or_non_integer_values_in_int_columns(bad):
+    patients = _records(2)
+    patients[1]["age"] = bad
+    with pytest.raises(ValueError):
+        Cohort.from_records(patients)
+
+
+def test_cohort_empty_inputs():
+    for empty in (Cohort.from_records([]), Cohort.generate(0), Cohort.concat([]), LazyCohort(10)[5:5].to_cohort()):
+        assert len(empty) == 0
+        assert empty.to_records() == []
+        assert list(empty.to_dataframe().columns) == SCHEMA
+
+
+# -----------------------------
+# risk.RiskEngine
+# -----------------------------
+def _patient(i, **fields):
+    """A record that fires no default rule, with `fields` overridden."""
+    quiet = {"diabetes_type": "T2", "hba1c_percent": 6.8, "fasting_glucose_mg_dL": 120.0, "systolic_bp": 120,
+             "diastolic_bp": 78, "ldl_cholesterol_mg_dL": 100, "medical_history": "none",
+             "ongoing_medications": "Metformin", "BMI": 27.0, "smoking_status": "never"}
+    return {**ds.gen_patient_at(i, today="2026-01-15"), **quiet, **fields}
+
+
+def _fired_names(engine, records):
+    fired = engine.fired(Cohort.from_records(records))
+    return [{rule["name"] for rule, hit in zip(engine.rules, fired[:, j]) if hit} for j in range(len(records))]
+
+
+def test_default_rules_fire_on_the_intended_records():
+    records = [
+        _patient(0),
+        _patient(1, hba1c_percent=9.4),
+        _patient(2, hba1c_percent=8.3),
+        _patient(3, diabetes_type="0", hba1c_percent=6.9, ongoing_medications="none"),
+        _patient(4, systolic_bp=150, diastolic_bp=85),
+        _patient(5, systolic_bp=185, diastolic_bp=95),
+        _patient(6, systolic_bp=130, diastolic_bp=112),
+        _patient(7, medical_history="hypertension; stroke", smoking_status="current", BMI=41.0),
+        _patient(8, hba1c_percent=7.5, ongoing_medications="none", ldl_cholesterol_mg_dL=175),
+        _patient(9, fasting_glucose_mg_dL=260.0, medical_history="nephropathy"),
+    ]
+    assert _fired_names(RiskEngine(), records) == [
+        set(),
+        {"a1c_poor_control"},
+        {"a1c_above_target"},
+        {"a1c_undiagnosed"},
+        {"bp_stage2"},
+        {"bp_severe"},
+        {"bp_severe"},
+        {"cardiovascular_history", "diabetic_smoker", "severe_obesity"},
+        {"t2_untreated", "ldl_high"},
+        {"fasting_glucose_high", "diabetic_complications"},
+    ]
+    weights = {rule["name"]: rule["weight"] for rule in DEFAULT_RULES}
+    scores = RiskEngine().score(Cohort.from_records(records))
+    assert scores.tolist() == [sum(weights[n] for n in names) for names in _fired_names(RiskEngine(), records)]
+
+
+def test_alerts_and_needs_attention():
+    records = [_patient(0), _patient(1, hba1c_percent=9.4, systolic_bp=150), _patient(2, systolic_bp=190),
+               _patient(3, BMI=42.0)]
+    cohort = Cohort.from_records(records)
+    engine = RiskEngine()
+    assert engine.alerts(cohort, [1, 0]) == [
+        ["HbA1c 9.4% - poor glycemic control", "Blood pressure 150/78 - stage 2 hypertension"], []]
+
+    top = engine.needs_attention(cohort, engine.build_index(cohort), k=3)
+    assert [(p["patient_id"], p["risk_score"]) for p in top] == [("P2001", 4.5), ("P2002", 3.0), ("P2003", 1.0)]
+    assert top[0]["name"] == records[1]["name"]
+    assert top[1]["recentAlerts"] == ["Blood pressure 190/78 - severely elevated"]
+    assert engine.needs_attention(cohort, engine.build_index(cohort), k=10, min_score=2.0)[-1]["patient_id"] == "P2002"
+
+
+def test_custom_rules_default_alert_and_are_checked(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"name": "tachycardia", "weight": 1, "when": [["heart_rate_bpm", ">", 0]]}]))
+    engine = RiskEngine(load_rules(str(path)))
+    assert engine.alerts(Cohort.from_records([_patient(0)]), [0]) == [["tachycardia"]]
+
+    bad_rules = [
+        {"weight": 1, "when": [["BMI", ">", 30]]},
+        {"name": "x", "when": [["BMI", ">", 30]]},
+        {"name": "x", "weight": 1},
+        {"name": "x", "weight": 1, "when": [["BMI", ">"]]},
+        {"name": "x", "weight": 1, "when": [["bmi", ">", 30]]},
+        {"name": "x", "weight": 1, "when": [["BMI", "~", 30]]},
+        {"name": "x", "weight": 1, "when": [["diabetes_type", "in", "T2"]]},
+        {"name": "x", "weight": 1, "when": [["BMI", ">", 30]], "alert": "BMI {bmi}"},
+    ]
+    for rule in bad_rules:
+        with pytest.raises(ValueError):
+            RiskEngine([rule])
+
+
+# -----------------------------
+# risk.RiskIndex
+# -----------------------------
+def _assert_index_matches_rebuild(index):
+    fresh = RiskIndex(index.scores)
+    assert len(index) == len(index.scores)
+    assert sorted(index.order.tolist()) == list(range(len(index.scores)))
+    np.testing.assert_array_equal(index.keys, fresh.keys)
+    np.testing.assert_array_equal(index.scores[index.order], -index.keys)
+
+
+def test_risk_index_incremental_matches_full_rebuild():
+    rng = np.random.RandomState(0)
+    index = RiskIndex(rng.randint(0, 20, 500).astype(np.float32))
+    for _ in range(5):
+        index.update(rng.choice(500, 40, replace=False), rng.randint(0, 20, 40))
+        _assert_index_matches_rebuild(index)
+    index.append(rng.randint(0, 20, 50))
+    _assert_index_matches_rebuild(index)
+    np.testing.assert_array_equal(index.at_least(15), index.order[:np.sum(index.scores >= 15)])
+
+
+def test_risk_index_update_with_duplicate_positions_keeps_last_score():
+    index = RiskIndex([1.0, 2.0, 3.0, 4.0])
+    index.update([0, 2, 0, 0], [9.0, 5.0, 7.0, 8.0])
+    assert len(index) == 4
+    assert index.scores.tolist() == [8.0, 2.0, 5.0, 4.0]
+    assert index.order.tolist() == [0, 2, 3, 1]
+    _assert_index_matches_rebuild(index)
+    with pytest.raises(IndexError):
+        index.update([4], [1.0])
+
+
+def test_risk_engine_refresh_matches_rescoring():
+    cohort = Cohort.from_records(_records(100))
+    engine = RiskEngine()
+    index = engine.build_index(cohort)
+    expected = index.scores.copy()
+    cohort["hba1c_percent"][:10] = 13.0
+    engine.refresh(cohort, index, [3, 3, 7])
+    expected[[3, 7]] = engine.score(cohort)[[3, 7]]
+    np.testing.assert_array_equal(index.scores, expected)
+    _assert_index_matches_rebuild(index)
+
+
+# -----------------------------
+# cohort_store
+# -----------------------------
+def test_store_grow_continues_ids_and_compact_merges_runs(tmp_path):
+    root = str(tmp_path / "store")
+    store.init_store(root, from_file=os.path.join(HERE, "patient_dataset_20.json"), today="2026-01-15")
+    with open(os.path.join(HERE, "patient_dataset_20.json"), encoding="utf-8") as f:
+        adopted = json.load(f)
+    for _ in range(3):
+        store.grow(root, 30, partition_size=20)
+    manifest = store.load_manifest(root)
+    assert manifest["next_index"] == 110
+    assert [(p["start"], p["count"]) for p in manifest["partitions"]] == [
+        (0, 20), (20, 20), (40, 10), (50, 20), (70, 10), (80, 20), (100, 10)]
+    before = list(store.iter_patients(root))
+    assert before[20:] == list(ds.iter_patient_range(20, 110, today="2026-01-15"))
+    assert [ds.patient_index(p["patient_id"]) for p in before] == list(range(110))
+    assert before[:20] == adopted
+
+    merged = store.compact(root, min_rows=50)
+    manifest = store.load_manifest(root)
+    assert [(p["start"], p["count"]) for p in merged] == [(0, 50), (50, 50)]
+    assert [(p["start"], p["count"]) for p in manifest["partitions"]] == [(0, 50), (50, 50), (100, 10)]
+    assert manifest["partitions"][:2] == merged and manifest["next_index"] == 110
+    live = [store.MANIFEST_NAME] + [p["file"] for p in manifest["partitions"]]
+    assert sorted(os.listdir(root)) == sorted(live)
+    assert list(store.iter_patients(root)) == before
+    assert store.compact(root, min_rows=50) == []
+
+
+@pytest.mark.parametrize("n_new, partition_size", [(10, -5), (10, 0), (10, 2.5), (0, None), (-3, None), (True, None), (5.0, None)])
+def test_store_grow_rejects_bad_sizes_without_touching_manifest(tmp_path, n_new, partition_size):
+    root = str(tmp_path / "store")
+    store.init_store(root)
+    store.grow(root, 5)
+    with pytest.raises(ValueError):
+        store.grow(root, n_new, partition_size=partition_size)
+    manifest = store.load_manifest(root)
+    assert manifest["next_index"] == 5 and len(manifest["partitions"]) == 1
+    assert len(os.listdir(root)) == 2
+
+
+# -----------------------------
+# validate_cohort
+# -----------------------------
+@pytest.mark.parametrize("chunk_chars", [1, 7, 64, 1 << 20])
+def test_iter_json_records_across_chunk_boundaries(tmp_path, chunk_chars):
+    path = tmp_path / "p.json"
+    patients = _records(15)
+    path.write_text(json.dumps(patients, indent=2), encoding="utf-8")
+    assert list(vc.iter_json_records(str(path), chunk_chars)) == patients
+
+    path.write_text("[1, 23456, 7.5e3, \"x\", [1, 2], null]", encoding="utf-8")
+    assert list(vc.iter_json_records(str(path), chunk_chars)) == [1, 23456, 7.5e3, "x", [1, 2], None]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("[]", []), (" \n[ ]\n", []), ("[{}]", [{}]), ("[1 ,2\n,\t3]  \n", [1, 2, 3]), ("[[], {}]", [[], {}]),
+])
+def test_iter_json_records_edge_inputs(tmp_path, text, expected):
+    path = tmp_path / "p.json"
+    path.write_text(text, encoding="utf-8")
+    assert list(vc.iter_json_records(str(path), 2)) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "", "{}", "[{\"a\": 1}", "[{\"a\": 1}, {\"a\"",
+    "[1 2]", "[,,1]", "[1,,2]", "[1,]", "[,]", "[{\"a\":1}{\"a\":2}]", "[1] garbage", "[1]]", "[] []", "[7.5x]",
+])
+def test_iter_json_records_rejects_non_arrays_and_truncation(tmp_path, text):
+    path = tmp_path / "p.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(vc.iter_json_records(str(path), 3))
+
+
+@pytest.mark.parametrize("name", ["patient_dataset_20.json", "patient_dataset_20.csv"])
+def test_repo_cohort_files_validate_clean(name):
+    report = vc.validate_file(os.path.join(HERE, name))
+    assert report["rows"] == 20 and report["errors"] == 0
+
+
+def test_validator_catches_planted_errors_and_duplicates(tmp_path):
+    patients = _records(50)
+    patients[4]["systolic_bp"] = 400
+    patients[9]["ongoing_medications"] = "insulin" if patients[9]["diabetes_type"] == "T2" else "Metformin"
+    patients[30]["patient_id"] = patients[2]["patient_id"]
+    patients.append(dict(patients[40]))
+    path = tmp_path / "p.json"
+    path.write_text(json.dumps(patients), encoding="utf-8")
+
+    report = vc.validate_file(str(path), batch_size=16)
+    counts = {v["rule"]: v["count"] for v in report["violations"]}
+    assert counts["systolic_bp_range"] == 1
+    assert counts["medication_allowed_for_type"] == 1
+    assert counts["duplicate_patient_id"] == 2
+    assert report["rows"] == 51
+
+
+def test_seen_ids_counts_repeats_within_and_across_batches():
+    seen = vc.SeenIds()
+    seen.add([2005, 2003, 2005])
+    seen.add([])
+    seen.add([1990, 2003, 9000])
+    assert seen.duplicates == 2 and seen.unchecked == 0
+    assert seen.bits.nbytes <= 2 * (9000 - 1990) // 8 + 2
+
+    capped = vc.SeenIds(max_span=64)
+    capped.add([0, 5, 5, 10_000])
+    assert capped.duplicates == 1 and capped.unchecked == 1
+
+
+def test_store_grow_uses_manifest_date_and_reference(tmp_path, monkeypatch):
+    ref_csv = tmp_path / "ref.csv"
+    pd.DataFrame({"HighBP": [1, 0, 1], "BMI": [41.0, 22.0, 35.0], "Sex": [1, 2, 2], "Age": [9, 4, 12]}).to_csv(
+        ref_csv, index=False)
+    root = str(tmp_path / "store")
+    manifest = store.init_store(root, today=date(2026, 1, 15), ref_csv=str(ref_csv))
+    assert manifest["today"] == "2026-01-15" and manifest["ref_csv"]["path"] == str(ref_csv)
+
+    monkeypatch.setattr(ds, "TODAY", datetime(2030, 6, 1))
+    store.grow(root, 12, partition_size=5)
+    expected = list(ds.iter_patient_range(0, 12, ref_df=pd.read_csv(ref_csv), today="2026-01-15"))
+    assert list(store.iter_patients(root)) == expected
+
+    ref_csv.write_text("HighBP,BMI\n1,50.0\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        store.grow(root, 5)
+    os.remove(ref_csv)
+    with pytest.raises(FileNotFoundError):
+        store.grow(root, 5)
+    assert store.load_manifest(root)["next_index"] == 12
+
+
+def test_store_grow_streams_patients_to_the_saver(tmp_path, monkeypatch):
+    root = str(tmp_path / "store")
+    store.init_store(root)
+    received = []
+    save_json = ds.SAVERS["json"]
+
+    def saver(patients, path):
+        received.append(type(patients))
+        save_json(patients, path)
+
+    monkeypatch.setitem(ds.SAVERS, "json", saver)
+    parts = store.grow(root, 25, partition_size=10)
+    assert [p["count"] for p in parts] == [10, 10, 5]
+    assert all(t is not list for t in received)
+    store.compact(root, min_rows=100)
+    assert all(t is not list for t in received)
+    assert len(list(store.iter_patients(root))) == 25
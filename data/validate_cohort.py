@@ -0,0 +1,448 @@
+"""
+validate_cohort.py
+------------------
+Check a finished synthetic cohort (JSON / CSV / Parquet) against the clinical
+invariants that dataset_20.py only enforces implicitly (np.clip bounds, nudges,
+allowed option sets).
+
+- Files are streamed in batches (JSON arrays are decoded incrementally, CSV via
+  pandas chunks, Parquet via pyarrow row batches), so only one batch is in memory.
+- Duplicate patient_ids are found with a bitmap over the numeric part of the ID
+  (one bit per ID between the smallest and largest seen): 1.25 MB for 10M
+  contiguous P2000.. IDs. IDs that would stretch the bitmap past MAX_ID_SPAN are
+  counted as unchecked instead.
+- Every rule is evaluated column-wise on the whole batch (NumPy masks).
+- The report gives per-rule violation counts plus a few sample rows.
+
+Severity:
+- error:   cannot happen with dataset_20 (value outside a clip bound, option not in
+           the allowed set, BMI inconsistent with height/weight, ...)
+- warning: possible but rare by design (e.g. non-diabetic with HbA1c >= 6.5,
+           independently drawn systolic/diastolic with systolic <= diastolic)
+
+Run:
+    python data/validate_cohort.py data/patient_dataset_20.json
+    python data/validate_cohort.py big_cohort.csv --batch-size 200000 --report report.json
+
+Exit code is 1 if any error-level rule fired.
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+import dataset_20 as ds
+from cohort import CATEGORIES, SCHEMA
+
+
+DEFAULT_BATCH_SIZE = 100_000
+DEFAULT_SAMPLES = 5
+MAX_ID_SPAN = 1 << 32  # bits, i.e. a 512 MB bitmap at most
+
+# dob is TODAY - age years - [0, 364] days; hba1c_date is TODAY - [1, 180] days.
+# So (hba1c_date - dob) in years minus age lies in [-180/365, 363/365] (+ leap-day slack).
+DOB_AGE_SLACK = (-0.51, 1.01)
+BMI_TOLERANCE = 0.15
+
+ALLOWED_MEDICATIONS = {
+    "T2": ["none", "Metformin", "sitagliptin"],
+    "T1": ["none"],
+    "0": ["none"],
+}
+
+
+# -----------------------------
+# 1) BATCH READERS
+# -----------------------------
+def iter_json_records(path, chunk_chars=1 << 20):
+    """
+    Yield the items of a top-level JSON array without loading the whole file.
+    Strict like json.load: items need exactly one ',' between them, and only
+    whitespace may follow the closing ']' (ValueError otherwise).
+    """
+    decoder = json.JSONDecoder()
+    # state: "open" (expect '['), "first" (item or ']'), "item", "sep" (',' or ']'), "done"
+    with open(path, encoding="utf-8") as f:
+        buf, pos, state, eof = "", 0, "open", False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    if state == "done":
+                        return
+                    raise ValueError(f"{path}: unexpected end of JSON array")
+                chunk = f.read(chunk_chars)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+
+            char = buf[pos]
+            if state == "open":
+                if char != "[":
+                    raise ValueError(f"{path}: expected a JSON array")
+                state, pos = "first", pos + 1
+            elif state == "done":
+                raise ValueError(f"{path}: unexpected data after the closing ']'")
+            elif state == "sep":
+                if char not in ",]":
+                    raise ValueError(f"{path}: expected ',' or ']' after an item, got {char!r}")
+                state, pos = ("item" if char == "," else "done"), pos + 1
+            elif state == "first" and char == "]":
+                state, pos = "done", pos + 1
+            elif char in ",]":
+                raise ValueError(f"{path}: expected a value before {char!r}")
+            else:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # A number can decode from a prefix ("7" of "7.5"); only trust values
+                    # followed by a separator, or at the end of the file.
+                    if eof or (end < len(buf) and buf[end] in " \t\r\n,]"):
+                        state, pos = "sep", end
+                        yield obj
+                        continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                chunk = f.read(chunk_chars)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+
+
+def iter_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield DataFrames of up to batch_size rows from a JSON / CSV / Parquet cohort file."""
+    fmt = path.rsplit(".", 1)[-1].lower()
+    if fmt == "json":
+        batch = []
+        for record in iter_json_records(path):
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield pd.DataFrame.from_records(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch)
+    elif fmt == "csv":
+        yield from pd.read_csv(path, chunksize=batch_size, keep_default_na=False,
+                               dtype={"patient_id": str, "diabetes_type": str})
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("validating Parquet needs pyarrow (pip install pyarrow)")
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield record_batch.to_pandas()
+    else:
+        raise ValueError(f"unsupported file type: {path}")
+
+
+# -----------------------------
+# 2) RULES
+# -----------------------------
+class Batch:
+    """A DataFrame batch with cached numeric / string / date views of its columns."""
+
+    def __init__(self, df):
+        self.df = df
+        self._cache = {}
+
+    def num(self, col):
+        key = ("num", col)
+        if key not in self._cache:
+            self._cache[key] = pd.to_numeric(self.df[col], errors="coerce").to_numpy(dtype=float)
+        return self._cache[key]
+
+    def text(self, col):
+        key = ("text", col)
+        if key not in self._cache:
+            self._cache[key] = self.df[col].astype(str).to_numpy(dtype=object)
+        return self._cache[key]
+
+    def date(self, col):
+        """datetime64[D] array (NaT where unparseable); ISO fast path, then mixed formats."""
+        key = ("date", col)
+        if key not in self._cache:
+            raw = self.df[col].astype(str)
+            parsed = pd.to_datetime(raw, format="%Y-%m-%d", errors="coerce")
+            bad = parsed.isna()
+            if bad.any():
+                parsed[bad] = pd.to_datetime(raw[bad], format="mixed", errors="coerce")
+            self._cache[key] = parsed.to_numpy().astype("datetime64[D]")
+        return self._cache[key]
+
+
+def out_of_range(col, lo, hi):
+    """Rule: numeric column outside [lo, hi] (non-numeric values count as violations)."""
+    return {
+        "name": f"{col}_range", "severity": "error", "columns": [col],
+        "description": f"{col} outside [{lo}, {hi}]",
+        "check": lambda b: ~((b.num(col) >= lo) & (b.num(col) <= hi)),
+    }
+
+
+def not_in_domain(col, values):
+    """Rule: categorical column not one of `values`."""
+    return {
+        "name": f"{col}_domain", "severity": "error", "columns": [col],
+        "description": f"{col} not in {list(values)}",
+        "check": lambda b: ~np.isin(b.text(col), list(values)),
+    }
+
+
+def _a1c_check(b, types, lo, hi):
+    a1c = b.num("hba1c_percent")
+    return np.isin(b.text("diabetes_type"), types) & (a1c >= lo) & (a1c < hi)
+
+
+def _bmi_check(b):
+    weight, height, bmi = b.num("weight_kg"), b.num("height_cm"), b.num("BMI")
+    implied = weight / (height / 100.0) ** 2
+    # weight is clipped to [40, 250] after being derived from BMI, so skip rows at the clip
+    clipped = (weight <= 40) | (weight >= 250)
+    return ~(np.abs(implied - bmi) <= BMI_TOLERANCE) & ~clipped
+
+
+def _dob_age_check(b):
+    years = (b.date("hba1c_date") - b.date("dob")).astype(float) / 365.2425
+    gap = years - b.num("age")
+    return ~((gap >= DOB_AGE_SLACK[0]) & (gap <= DOB_AGE_SLACK[1]))
+
+
+def _medication_check(b):
+    types, meds = b.text("diabetes_type"), b.text("ongoing_medications")
+    allowed = np.zeros(len(types), dtype=bool)
+    for dtype, options in ALLOWED_MEDICATIONS.items():
+        allowed |= (types == dtype) & np.isin(meds, options)
+    return ~allowed
+
+
+def _history_items_check(b):
+    codes, uniques = pd.factorize(b.text("medical_history"))
+    valid_items = set(ds.MED_HISTORY_OPTIONS)
+    bad = np.array([
+        text != "none" and not {item.strip() for item in text.split(";")} <= valid_items
+        for text in uniques
+    ], dtype=bool)
+    return bad[codes]
+
+
+def _history_contains(b, items):
+    codes, uniques = pd.factorize(b.text("medical_history"))
+    hit = np.array([any(item in text for item in items) for text in uniques], dtype=bool)
+    return hit[codes]
+
+
+RULES = [
+    {"name": "patient_id_format", "severity": "error", "columns": ["patient_id"],
+     "description": "patient_id is not P<digits>",
+     "check": lambda b: ~b.df["patient_id"].astype(str).str.fullmatch(r"P\d+").to_numpy(dtype=bool)},
+    out_of_range("age", 18, 88),
+    out_of_range("height_cm", 145, 200),
+    out_of_range("weight_kg", 40, 250),
+    out_of_range("BMI", 17.0, 55.0),
+    out_of_range("systolic_bp", 95, 200),
+    out_of_range("diastolic_bp", 55, 120),
+    out_of_range("heart_rate_bpm", 50, 110),
+    out_of_range("fasting_glucose_mg_dL", 65, 350),
+    out_of_range("postprandial_glucose_mg_dL", 80, 450),
+    out_of_range("hba1c_percent", 4.5, 14.0),
+    out_of_range("total_cholesterol_mg_dL", 110, 320),
+    out_of_range("ldl_cholesterol_mg_dL", 50, 220),
+    out_of_range("hdl_cholesterol_mg_dL", 25, 100),
+    out_of_range("triglycerides_mg_dL", 45, 600),
+    out_of_range("years_since_diagnosis", 0, 35),
+    *[not_in_domain(col, values) for col, values in CATEGORIES.items() if col in SCHEMA],
+    {"name": "bp_order", "severity": "warning", "columns": ["systolic_bp", "diastolic_bp"],
+     "description": "systolic_bp not above diastolic_bp",
+     "check": lambda b: ~(b.num("systolic_bp") > b.num("diastolic_bp"))},
+    {"name": "bmi_consistency", "severity": "error", "columns": ["BMI", "weight_kg", "height_cm"],
+     "description": f"BMI differs from weight/height^2 by more than {BMI_TOLERANCE}",
+     "check": _bmi_check},
+    {"name": "dob_age_consistency", "severity": "error", "columns": ["dob", "age", "hba1c_date"],
+     "description": "dob does not match age (relative to hba1c_date)",
+     "check": _dob_age_check},
+    {"name": "non_diabetic_diagnosis_years", "severity": "error",
+     "columns": ["diabetes_type", "years_since_diagnosis"],
+     "description": "non-diabetic with years_since_diagnosis != 0",
+     "check": lambda b: (b.text("diabetes_type") == "0") & ~(b.num("years_since_diagnosis") == 0)},
+    {"name": "medication_allowed_for_type", "severity": "error",
+     "columns": ["diabetes_type", "ongoing_medications"],
+     "description": "ongoing_medications not allowed for diabetes_type (T2: none/Metformin/sitagliptin, else none)",
+     "check": _medication_check},
+    {"name": "medical_history_items", "severity": "error", "columns": ["medical_history"],
+     "description": "medical_history has items outside MED_HISTORY_OPTIONS",
+     "check": _history_items_check},
+    {"name": "non_diabetic_complications", "severity": "error", "columns": ["diabetes_type", "medical_history"],
+     "description": "non-diabetic with diabetic retinopathy or diabetic foot ulcer/amputation",
+     "check": lambda b: (b.text("diabetes_type") == "0") & _history_contains(
+         b, ["diabetic retinopathy", "history of diabetic foot ulcer or amputation"])},
+    {"name": "a1c_diabetic_range_without_diabetes", "severity": "warning",
+     "columns": ["diabetes_type", "hba1c_percent"],
+     "description": "non-diabetic with HbA1c >= 6.5 (diabetes range)",
+     "check": lambda b: _a1c_check(b, ["0"], 6.5, np.inf)},
+    {"name": "a1c_normal_range_with_diabetes", "severity": "warning",
+     "columns": ["diabetes_type", "hba1c_percent"],
+     "description": "T1/T2 with HbA1c < 5.7 (normal range)",
+     "check": lambda b: _a1c_check(b, ["T1", "T2"], -np.inf, 5.7)},
+]
+
+
+# -----------------------------
+# 3) VALIDATOR
+# -----------------------------
+class SeenIds:
+    """Bitmap of numeric patient IDs seen so far; counts repeats, including within one add()."""
+
+    def __init__(self, max_span=MAX_ID_SPAN):
+        self.max_span = max_span
+        self.lo = None
+        self.bits = np.zeros(0, dtype=np.uint8)
+        self.duplicates = 0
+        self.unchecked = 0
+
+    def add(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        self._reserve(int(ids.min()), int(ids.max()) + 1)
+        inside = (ids >= self.lo) & (ids < self.lo + 8 * len(self.bits))
+        self.unchecked += int(len(ids) - inside.sum())
+        ids = np.sort(ids[inside])
+        if len(ids) == 0:
+            return
+        unique = ids[np.r_[True, ids[1:] != ids[:-1]]]
+        offsets = unique - self.lo
+        byte, bit = offsets >> 3, (1 << (offsets & 7)).astype(np.uint8)
+        self.duplicates += len(ids) - len(unique) + int(np.count_nonzero(self.bits[byte] & bit))
+        # offsets are sorted, so OR the bits of each byte together before writing them back
+        starts = np.flatnonzero(np.r_[True, byte[1:] != byte[:-1]])
+        self.bits[byte[starts]] |= np.bitwise_or.reduceat(bit, starts)
+
+    def _reserve(self, lo, hi):
+        """Grow the bitmap (doubling, byte-aligned) to cover [lo, hi), within max_span."""
+        lo -= lo % 8
+        if self.lo is None:
+            self.lo = lo
+        cur_hi = self.lo + 8 * len(self.bits)
+        new_lo, new_hi = min(self.lo, lo), max(cur_hi, hi)
+        if new_hi - new_lo > self.max_span:
+            new_lo = self.lo
+            new_hi = min(new_hi, new_lo + self.max_span)
+        if new_lo == self.lo and new_hi <= cur_hi:
+            return
+        n_bytes = max(-(-(new_hi - new_lo) // 8), min(2 * len(self.bits), self.max_span // 8))
+        bits = np.zeros(n_bytes, dtype=np.uint8)
+        shift = (self.lo - new_lo) // 8
+        bits[shift:shift + len(self.bits)] = self.bits
+        self.bits, self.lo = bits, new_lo
+
+
+class Validator:
+    """Accumulates rule violations over streamed batches; call report() at the end."""
+
+    def __init__(self, rules=None, n_samples=DEFAULT_SAMPLES):
+        self.rules = list(RULES if rules is None else rules)
+        self.n_samples = n_samples
+        self.rows = 0
+        self.missing_columns = set()
+        self.counts = {rule["name"]: 0 for rule in self.rules}
+        self.samples = {rule["name"]: [] for rule in self.rules}
+        self.seen_ids = SeenIds()
+
+    def validate_batch(self, df):
+        batch = Batch(df)
+        self.missing_columns |= set(SCHEMA) - set(df.columns)
+        for rule in self.rules:
+            if any(col not in df.columns for col in rule["columns"]):
+                continue
+            bad = np.flatnonzero(rule["check"](batch))
+            if len(bad) == 0:
+                continue
+            name = rule["name"]
+            self.counts[name] += len(bad)
+            need = self.n_samples - len(self.samples[name])
+            if need > 0:
+                for pos in bad[:need]:
+                    sample = {"row": self.rows + int(pos)}
+                    for col in ["patient_id", *rule["columns"]]:
+                        if col in df.columns:
+                            value = df[col].iloc[pos]
+                            sample[col] = value.item() if hasattr(value, "item") else value
+                    self.samples[name].append(sample)
+        if "patient_id" in df.columns:
+            ids = df["patient_id"].astype(str).str.extract(r"^P(\d{1,18})$")[0]
+            self.seen_ids.add(pd.to_numeric(ids, errors="coerce").dropna().to_numpy(dtype=np.int64))
+        self.rows += len(df)
+
+    def duplicate_ids(self):
+        """Count of rows whose patient_id already appeared earlier in the stream."""
+        return self.seen_ids.duplicates
+
+    def report(self):
+        severity = {rule["name"]: rule["severity"] for rule in self.rules}
+        description = {rule["name"]: rule["description"] for rule in self.rules}
+        violations = [
+            {"rule": name, "severity": severity[name], "description": description[name],
+             "count": count, "samples": self.samples[name]}
+            for name, count in self.counts.items() if count
+        ]
+        duplicates = self.duplicate_ids()
+        if duplicates:
+            violations.append({"rule": "duplicate_patient_id", "severity": "error",
+                               "description": "patient_id appears more than once", "count": duplicates,
+                               "samples": []})
+        if self.seen_ids.unchecked:
+            violations.append({"rule": "patient_id_not_checked", "severity": "warning",
+                               "description": f"patient_id outside the {MAX_ID_SPAN:,}-wide ID window, "
+                                              "not checked for duplicates",
+                               "count": self.seen_ids.unchecked, "samples": []})
+        if self.missing_columns:
+            violations.append({"rule": "missing_columns", "severity": "error",
+                               "description": f"missing columns: {sorted(self.missing_columns)}",
+                               "count": len(self.missing_columns), "samples": []})
+        return {
+            "rows": self.rows,
+            "errors": sum(v["count"] for v in violations if v["severity"] == "error"),
+            "warnings": sum(v["count"] for v in violations if v["severity"] == "warning"),
+            "violations": violations,
+        }
+
+
+def validate_file(path, batch_size=DEFAULT_BATCH_SIZE, n_samples=DEFAULT_SAMPLES, rules=None):
+    validator = Validator(rules, n_samples)
+    for df in iter_batches(path, batch_size):
+        validator.validate_batch(df)
+    return validator.report()
+
+
+def print_report(path, report):
+    print(f"{path}: {report['rows']:,} rows, {report['errors']:,} errors, {report['warnings']:,} warnings")
+    for v in report["violations"]:
+        print(f"\n[{v['severity']}] {v['rule']}: {v['count']:,} ({v['description']})")
+        for sample in v["samples"]:
+            print(f"    {sample}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a generated patient cohort (JSON / CSV / Parquet).")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="sample rows kept per rule")
+    parser.add_argument("--report", metavar="PATH", help="also write the report(s) as JSON")
+    args = parser.parse_args(argv)
+
+    reports = {}
+    for path in args.paths:
+        reports[path] = validate_file(path, args.batch_size, args.samples)
+        print_report(path, reports[path])
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2, default=str)
+    return 1 if any(r["errors"] for r in reports.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())